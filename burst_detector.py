@@ -0,0 +1,171 @@
+"""
+The idea of this file is to find the signals of a passage without someone pressing a button for each one
+It follows the signal strength (dbfs) that gqrx already samples in the background, so it adds no commands to gqrx,
+finds the bursts that rise above the noise floor and guesses which signal each one is from the expected intervals
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class BurstDetector:
+    """
+    Polls the dbfs history on a background thread and registers an event for every burst it finds
+
+    A burst starts when the dbfs goes threshold_db above the noise floor and ends when it drops below half of that.
+    The noise floor is a low percentile of the recent samples that were not part of a burst.
+
+    The type of the burst comes from the intervals (signal name : expected seconds between two of them).
+    Signals that repeat more often are more likely to begin with. Then for every type the bursts that were found
+    one, two and three intervals before are checked (within tolerance seconds), a type whose earlier bursts are there
+    becomes more likely and one whose earlier bursts are missing becomes less likely.
+    The confidence is how likely the chosen type is, scaled down for bursts that are barely above the threshold.
+    """
+
+    FLOOR_PERCENTILE = 0.2      # the floor is taken this far up the sorted recent samples
+    MIN_FLOOR_SAMPLES = 10      # no bursts are detected until the floor is known
+    LOOKBACK_PERIODS = 3        # number of earlier intervals checked for every type
+    HIT_LIKELIHOOD = 0.9        # an earlier burst was found where the type expects one
+    MISS_LIKELIHOOD = 0.2       # no burst where the type expects one, it may still have been too weak to detect
+
+    def __init__(self, history_function, register_function, intervals, threshold_db=6.0, min_duration=0.4,
+                 tolerance=5.0, min_confidence=0.3, poll_interval=1.0, floor_window=30.0):
+        """
+        history_function receives a unix timestamp and returns the dbfs sampled after it as {"times": [...], "values": [...]}
+        register_function receives the signal name, the unix timestamp of the start of the burst
+        and a dictionary with extra data (the confidence and the burst measurements)
+        """
+        self.history_function = history_function
+        self.register_function = register_function
+        self.intervals = intervals
+        self.threshold_db = threshold_db
+        self.min_duration = min_duration
+        self.tolerance = tolerance
+        self.min_confidence = min_confidence
+        self.poll_interval = poll_interval
+        self.floor_window = floor_window
+
+        self.recent = deque()       # (timestamp, dbfs) of the last floor_window seconds outside of bursts
+        self.burst = None           # {"start", "end", "peak", "floor"} of the burst in progress
+        self.bursts = deque()       # start of the bursts found, the ones older than the lookback are dropped
+        self.first_sample = None    # nothing is known about the time before this
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Starts following the dbfs from now on
+        """
+        self.thread = threading.Thread(target=self.run, name="BurstDetector", daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        """
+        Stops the detector, a burst still in progress is dropped
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+
+    def run(self):
+        """
+        Polling loop, every poll reads only the samples that are newer than the last one
+        """
+        cursor = time.time()
+
+        while not self.stop_event.wait(self.poll_interval):
+            try:
+                history = self.history_function(cursor)
+            except Exception as e:
+                print("Error getting the dbfs history for the burst detector: ", e)
+                continue
+
+            for timestamp, dbfs in zip(history["times"], history["values"]):
+                self.process(timestamp, dbfs)
+                cursor = timestamp
+
+    def floor(self):
+        """
+        Noise floor estimate, None until there are enough samples
+        """
+        if len(self.recent) < self.MIN_FLOOR_SAMPLES:
+            return None
+        values = sorted(dbfs for _, dbfs in self.recent)
+        return values[int(len(values) * self.FLOOR_PERCENTILE)]
+
+    def process(self, timestamp, dbfs):
+        """
+        Feeds a single sample to the detector
+        """
+        if self.first_sample is None:
+            self.first_sample = timestamp
+        floor = self.floor()
+
+        if self.burst is not None:
+            if dbfs >= self.burst["floor"] + self.threshold_db / 2:
+                self.burst["end"] = timestamp
+                self.burst["peak"] = max(self.burst["peak"], dbfs)
+                return
+
+            burst, self.burst = self.burst, None
+            if burst["end"] - burst["start"] >= self.min_duration:
+                self.report(burst)
+
+        elif floor is not None and dbfs >= floor + self.threshold_db:
+            # the floor is frozen for the whole burst, otherwise a long burst would raise it
+            self.burst = {"start": timestamp, "end": timestamp, "peak": dbfs, "floor": floor}
+            return
+
+        self.recent.append((timestamp, dbfs))
+        while self.recent and self.recent[0][0] < timestamp - self.floor_window:
+            self.recent.popleft()
+
+    def classify(self, start):
+        """
+        Returns the most likely signal for a burst that started at the given time and its probability
+        """
+        scores = {}
+        for name, interval in self.intervals.items():
+            likelihood = 1.0
+            for period in range(1, self.LOOKBACK_PERIODS + 1):
+                expected = start - period * interval
+                if expected < self.first_sample - self.tolerance:
+                    break   # before the detector started, it says nothing about this type
+                found = any(abs(burst - expected) <= self.tolerance for burst in self.bursts)
+                likelihood *= self.HIT_LIKELIHOOD if found else self.MISS_LIKELIHOOD
+            scores[name] = likelihood / interval
+
+        name = max(scores, key=scores.get)
+        return name, scores[name] / sum(scores.values())
+
+    def report(self, burst):
+        """
+        Classifies a finished burst and registers it when the confidence is high enough
+        """
+        name, probability = self.classify(burst["start"])
+        strength = min((burst["peak"] - burst["floor"]) / (2 * self.threshold_db), 1.0)
+        confidence = probability * strength
+
+        self.bursts.append(burst["start"])
+        lookback = max(self.intervals.values()) * self.LOOKBACK_PERIODS + self.tolerance
+        while self.bursts[0] < burst["start"] - lookback:
+            self.bursts.popleft()
+
+        if confidence < self.min_confidence:
+            print(f"Burst detector: ignoring {name} with confidence {confidence:.2f}")
+            return
+
+        extra_data = {
+            "source": "burst_detector",
+            "confidence": round(confidence, 3),
+            "burst_duration": round(burst["end"] - burst["start"], 3),
+            "burst_peak_dbfs": burst["peak"],
+            "noise_floor_dbfs": burst["floor"],
+        }
+        try:
+            self.register_function(name, burst["start"], extra_data)
+        except Exception as e:
+            print("Error registering the detected burst: ", e)
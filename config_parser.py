@@ -35,16 +35,78 @@ class ConfigParser:
         gqrx_port = 7356
         gqrx_rpc_host = "localhost"
         gqrx_rpc_port = 1712
+        gqrx_snapshot_mode = "pipelined"
+        gqrx_snapshot_budget = 0.05
+        gqrx_cache_ttl = 2.0
+        gqrx_uncached_fields = ["dbfs", "frequency"]
+        gqrx_timeout = 2.0
+        gqrx_health_interval = 5.0
+        gqrx_reconnect_min_delay = 0.5
+        gqrx_reconnect_max_delay = 30.0
+        
+        gqrx_mux_ip = "localhost"
+        gqrx_mux_port = 7356
+        gqrx_mux_listen_host = "localhost"
+        gqrx_mux_listen_port = 7357
+        gqrx_mux_rpc_host = "localhost"
+        gqrx_mux_rpc_port = 1714
+        gqrx_mux_cache_ttl = 0.1
+        gqrx_mux_quantum = 8
+        gqrx_mux_timeout = 2.0
+        gqrx_mux_health_interval = 5.0
+        gqrx_mux_reconnect_min_delay = 0.5
+        gqrx_mux_reconnect_max_delay = 30.0
         
         rotctl_ip = "localhost"
         rotctl_port = 4533
         rotctl_rpc_host = "localhost"
         rotctl_rpc_port = 1713
+        rotctl_min_azimuth = 0.0
+        rotctl_max_azimuth = 360.0
+        rotctl_min_elevation = 0.0
+        rotctl_max_elevation = 90.0
+        rotctl_timeout = 2.0
+        rotctl_health_interval = 5.0
+        rotctl_reconnect_min_delay = 0.5
+        rotctl_reconnect_max_delay = 30.0
+        
+        gqrx_sample_rate = 5
+        rotctl_sample_rate = 5
+        telemetry_buffer_size = 600
+        telemetry_max_age = 1.0
+        
+        rpc_server_mode = "threaded"
+        rpc_pool_size = 8
+        rpc_transport = "xmlrpc"
+        rpc_unix_folder = "/tmp"
+        rpc_call_timeout = 10.0
+        rpc_keepalive_timeout = 10.0
         
         manager_rpc_host = "localhost"
         manager_rpc_port = 1710
+        track_rate = 2
+        journal_folder = "passage_metadata/journal"
+        journal_fsync_every = 10
+        
+        burst_detector = False
+        burst_threshold_db = 6.0
+        burst_min_duration = 0.4
+        burst_timing_tolerance = 5.0
+        burst_min_confidence = 0.3
+        burst_poll_interval = 1.0
+        burst_floor_window = 30.0
         
         modules = ["gqrx_control", "rotctl_control", "manager", "new_ui"]
+        launch_mode = "thread"
+        gqrx_control_depends_on = []
+        rotctl_control_depends_on = []
+        gqrx_mux_depends_on = []
+        manager_depends_on = ["gqrx_control", "rotctl_control"]
+        new_ui_depends_on = ["manager"]
+        launch_ready_timeout = 30.0
+        launch_restart_min_delay = 1.0
+        launch_restart_max_delay = 30.0
+        launch_stop_timeout = 5.0
         
     
         # load all the variables defined in this functions to the dict
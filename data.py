@@ -2,6 +2,17 @@ import os
 import json
 from datetime import datetime
 
+from journal import EventJournal, read_journal
+from track import Track
+
+# expected time between two signals of each type, in seconds
+# used by the ui countdowns and by the burst detector to tell the signals apart
+SIGNAL_INTERVALS = {
+    "AFSK": 120,         # 2 minutes
+    "Beacon": 60,        # 1 minute
+    "Long Beacon": 300   # 5 minutes
+}
+
 class Event:
     """
     This is the class that will be responsible for representing an event.
@@ -9,9 +20,15 @@ class Event:
     
     This class should contain no logic, it is just to store data
     But it should have a method to convert the object into a dictionary for JSON serialization
+    
+    It uses __slots__ so that every event does not carry its own __dict__, there can be a lot of them
+    when archives are reloaded. Events built from data that is already known to be valid
+    should use Event.trusted, which skips the validation.
     """
     
-    def __init__(self, name, time, elapsed_str, freq, gain, azimuth, elevation, extra_data={}):
+    __slots__ = ("name", "time", "elapsed_str", "freq", "gain", "azimuth", "elevation", "extra_data")
+    
+    def __init__(self, name, time, elapsed_str, freq, gain, azimuth, elevation, extra_data=None):
         """
         name : str
             The name of the event
@@ -31,48 +48,87 @@ class Event:
             Any other data that might be needed
         """
         
-        if not isinstance(name, str):
-            raise ValueError(f"Event creation name {name} must be a string")
+        self.name = name
+        self.time = time
+        self.elapsed_str = elapsed_str
+        self.freq = freq
+        self.gain = gain
+        self.azimuth = azimuth
+        self.elevation = elevation
+        self.extra_data = {} if extra_data is None else extra_data   # a dictionary with any other extra data that might eventually be needed
+        
+        self.validate()
+    
+    @classmethod
+    def trusted(cls, name, time, elapsed_str, freq, gain, azimuth, elevation, extra_data=None):
+        """
+        Creates an event without validating the values, for internal callers that already build them with the right types
+        validate can still be called later if needed
+        """
+        event = cls.__new__(cls)
+        event.name = name
+        event.time = time
+        event.elapsed_str = elapsed_str
+        event.freq = freq
+        event.gain = gain
+        event.azimuth = azimuth
+        event.elevation = elevation
+        event.extra_data = {} if extra_data is None else extra_data
+        return event
+    
+    def validate(self):
+        """
+        Checks the type of every value, raises ValueError on the first one that is wrong
+        """
+        if not isinstance(self.name, str):
+            raise ValueError(f"Event creation name {self.name} must be a string")
 
-        if not isinstance(time, datetime):
-            raise ValueError(f"Event creation time {time} must be a datetime object")
+        if not isinstance(self.time, datetime):
+            raise ValueError(f"Event creation time {self.time} must be a datetime object")
         
-        if not isinstance(elapsed_str, str):
-            raise ValueError(f"Event creation elapsed_str {elapsed_str} must be a string")
+        if not isinstance(self.elapsed_str, str):
+            raise ValueError(f"Event creation elapsed_str {self.elapsed_str} must be a string")
         
-        if not isinstance(freq, float):
-            raise ValueError(f"Event creation freq {freq} must be a string")
+        if not isinstance(self.freq, float):
+            raise ValueError(f"Event creation freq {self.freq} must be a float")
         
-        if not isinstance(gain, str):
-            raise ValueError(f"Event creation gain {gain} must be a string")
+        if not isinstance(self.gain, str):
+            raise ValueError(f"Event creation gain {self.gain} must be a string")
 
-        if not isinstance(azimuth, float):
-            raise ValueError(f"Event creation azimuth {azimuth} must be a string")
+        if not isinstance(self.azimuth, float):
+            raise ValueError(f"Event creation azimuth {self.azimuth} must be a float")
     
-        if not isinstance(elevation, float):
-            raise ValueError(f"Event creation elevation {elevation} must be a string")
+        if not isinstance(self.elevation, float):
+            raise ValueError(f"Event creation elevation {self.elevation} must be a float")
         
-        if not isinstance(extra_data, dict):
-            raise ValueError(f"Event creation extra_data {extra_data} must be a dictionary")
+        if not isinstance(self.extra_data, dict):
+            raise ValueError(f"Event creation extra_data {self.extra_data} must be a dictionary")
         
         # check that all the data in the extra data is a string, int or float
-        for key in extra_data:
-            if not isinstance(extra_data[key], str) and not isinstance(extra_data[key], int) and not isinstance(extra_data[key], float):
-                raise ValueError(f"Extra data {extra_data[key]} must be a string, int or float")
-                
-        # check to see if time is the correct type
-        self.name = name
-        self.time = time
-        self.elapsed_str = elapsed_str
-        self.freq = freq
-        self.gain = gain
-        self.azimuth = azimuth
-        self.elevation = elevation
-        self.extra_data = extra_data   # a dictionary with any other extra data that might eventually be needed
+        for key, value in self.extra_data.items():
+            if not isinstance(value, (str, int, float)):
+                raise ValueError(f"Extra data {value} must be a string, int or float")
     
     def __str__(self):
         return f"{self.name} at {self.time} on {self.freq} with azimuth {self.azimuth} and elevation {self.elevation}"
 
+    @classmethod
+    def from_dict(cls, event_dict):
+        """
+        Creates an Event from a dictionary in the same format as the one returned by to_dict
+        the dictionary comes from our own dumps and journals, so it is not validated again
+        """
+        return cls.trusted(
+            event_dict["name"],
+            datetime.fromisoformat(event_dict["time"]),
+            event_dict["elapsed_time"],
+            event_dict["freq"],
+            event_dict["gain"],
+            event_dict["azimuth"],
+            event_dict["elevation"],
+            event_dict.get("extra_data", {})
+        )
+
     def to_dict(self):
         """
         Convert the Event object into a dictionary for JSON serialization.
@@ -88,21 +144,81 @@ class Event:
             "extra_data": self.extra_data
         }
 
+def write_passage(file, header, events, trailer=None):
+    """
+    Writes a passage json to an open file one event at a time
+    header and trailer are dictionaries with the fields that go before and after the event list,
+    events can be any iterable of event dictionaries (a generator reading from disk for example)
+    The result is the same as json.dump of the whole passage with indent=4
+    """
+    def encode(value, level):
+        # json only has new lines between elements (the ones in strings are escaped), so they can all be indented
+        return json.dumps(value, indent=4).replace("\n", "\n" + " " * 4 * level)
+    
+    fields = [f"    {json.dumps(key)}: {encode(value, 1)}" for key, value in header.items()]
+    file.write("{\n" + "".join(field + ",\n" for field in fields))
+    
+    file.write('    "event_list": [')
+    empty = True
+    for event in events:
+        file.write("\n" if empty else ",\n")
+        file.write(" " * 8 + encode(event, 2))
+        empty = False
+    file.write("]" if empty else "\n    ]")
+    
+    for key, value in (trailer or {}).items():
+        file.write(f",\n    {json.dumps(key)}: {encode(value, 1)}")
+    file.write("\n}")
+
+
 class MetaData:
     """
     This will be the class responsible for storing all the metadata during the passage.
     It will have methods to dump that metadata into a file for later use.
     """
     
-    def __init__(self):
+    def __init__(self, journal_folder=None, fsync_every=10):
         """
         All time values are expected to be datetime objects.
         They will be converted to text by this module
+        
+        When journal_folder is given every event is also appended to a journal file in that folder
+        as soon as it is registered, and the dump is built from that journal
         """
         self.comment = None
         self.start_record_time = None
         self.end_record_time = None
         self.event_list = []       # This will be ordered by adding time
+        self.track = Track()       # continuous azimuth, elevation and signal strength history of the passage
+        
+        self.journal_folder = journal_folder
+        self.fsync_every = fsync_every
+        self.journal = None        # EventJournal, opened when the recording starts
+    
+    @classmethod
+    def from_journal(cls, journal_path, fsync_every=10):
+        """
+        Rebuilds the metadata of a passage from its journal, used to recover passages that were never stopped
+        The journal is reopened, so stopping and dumping the returned object works like a normal passage
+        """
+        meta_data = cls(os.path.dirname(journal_path), fsync_every)
+        
+        for record in read_journal(journal_path):
+            record_type = record.pop("type", None)
+            if record_type == "start":
+                meta_data.comment = record.get("comment")
+                meta_data.start_record_time = datetime.fromisoformat(record["start_record_time"])
+            elif record_type == "stop":
+                meta_data.end_record_time = datetime.fromisoformat(record["end_record_time"])
+            elif record_type == "event":
+                # replayed directly into the list, register_event would write them to the journal again
+                meta_data.event_list.append(Event.from_dict(record))
+        
+        if meta_data.start_record_time is None:
+            raise ValueError(f"Journal {journal_path} has no start record")
+        
+        meta_data.journal = EventJournal(journal_path, fsync_every)
+        return meta_data
     
     def start_recording(self, current_time):
         """
@@ -115,6 +231,32 @@ class MetaData:
         
         self.start_record_time = current_time
         
+        if self.journal_folder:
+            self.journal = EventJournal(self.new_journal_path(current_time), self.fsync_every)
+            self.journal.append({"type": "start", "comment": self.comment, "start_record_time": current_time.isoformat()})
+        
+    def new_journal_path(self, current_time):
+        """
+        Path of the journal of a passage started at current_time, the name has a 1 second resolution
+        so a passage started in the same second as one whose journal is still there gets a _1, _2, ... suffix
+        """
+        base_path = os.path.join(self.journal_folder, current_time.strftime("%Y_%m_%d_%H-%M-%S"))
+        journal_path = base_path + ".jsonl"
+        count = 0
+        while os.path.exists(journal_path):
+            count += 1
+            journal_path = f"{base_path}_{count}.jsonl"
+        return journal_path
+    
+    def close(self):
+        """
+        Closes the journal without removing it, for a passage that is abandoned without being stopped
+        the passage is recovered from the journal the next time the manager starts
+        """
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+    
     def stop_recording(self, current_time):
         """
         This method is responsible for marking the end of the recording.
@@ -123,6 +265,10 @@ class MetaData:
             raise ValueError(f"Stop Recording time {current_time} must be a datetime object")
 
         self.end_record_time = current_time
+        
+        if self.journal is not None:
+            self.journal.append({"type": "stop", "end_record_time": current_time.isoformat()})
+            self.journal.sync()
 
     def register_event(self, event):
         """
@@ -135,8 +281,19 @@ class MetaData:
         
         self.event_list.append(event)
         
+        if self.journal is not None:
+            self.journal.append({"type": "event", **event.to_dict()})
+        
         return True
     
+    def journal_events(self):
+        """
+        Yields the events stored in the journal one by one, as dictionaries in the to_dict format
+        """
+        for record in read_journal(self.journal.file_path):
+            if record.pop("type", None) == "event":
+                yield record
+    
     def dump(self, file_folder="passage_metadata", file_name="", filename_suffix=""):
         """
         This method will dump the metadata into a file.
@@ -158,19 +315,38 @@ class MetaData:
                     
             file_path = os.path.join(file_folder, file_name)
             
-            # Prepare the metadata dictionary to be serialized
-            metadata_dict = {
+            header = {
                 "comment": self.comment,
                 "start_record_time": self.start_record_time.isoformat(),
                 "end_record_time": self.end_record_time.isoformat(),
-                "event_list": [event.to_dict() for event in self.event_list]  # Convert each event to dict
             }
             
-            print(metadata_dict)
+            # the events are written one at a time, so the whole passage never has to be in memory as a dictionary
+            if self.journal is not None:
+                # the journal is what made it to the disk, so that is what gets dumped
+                self.journal.sync()
+                events = self.journal_events()
+            else:
+                events = (event.to_dict() for event in self.event_list)
+            
+            # the track is too big for json, it goes to a binary file next to it
+            trailer = {}
+            if len(self.track) > 0:
+                track_file_name = os.path.splitext(file_name)[0] + ".track"
+                self.track.dump(os.path.join(file_folder, track_file_name))
+                trailer["track_file"] = track_file_name
+                trailer["track_samples"] = len(self.track)
+            
+            print("Dumping passage to: ", file_path)
             
             # Dump the data
             with open(file_path, "w") as file:
-                json.dump(metadata_dict, file, indent=4)
+                write_passage(file, header, events, trailer)
+            
+            # the passage is safely in its final file, the journal is not needed anymore
+            if self.journal is not None:
+                self.journal.remove()
+                self.journal = None
         
         except Exception as e:
             print("Error in dump: ", e)
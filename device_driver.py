@@ -0,0 +1,346 @@
+"""
+The idea of this file is to have the parts that are shared by the classes that talk to the devices (gqrx and rotctld)
+Both are line based sockets, both need the same connection handling (timeouts, reconnecting with backoff, health checks)
+and both are exposed to the rest of the system with an xmlrpc server.
+
+Every command that goes through the driver is also timed, so get_stats can show which device command is the bottleneck
+"""
+
+import logging
+from abc import ABC, abstractmethod
+import socket
+import threading
+import time
+
+from config_parser import ConfigParser
+from line_protocol import LineProtocol
+from rpc_server import create_rpc_server
+
+
+class CommandStats:
+    """
+    Per command counters and latency histogram
+    Commands are grouped by their name, numeric arguments are dropped ("F 437000000" is counted as "F")
+    """
+
+    # upper bound of each latency bucket in milliseconds, the last bucket is everything above
+    BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self):
+        self.commands = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def commandName(command):
+        """
+        Returns the name the command is counted under
+        """
+        return " ".join(word for word in command.split() if not CommandStats.isNumericWord(word)) or command
+
+    @staticmethod
+    def isNumericWord(word):
+        """
+        True for a command argument that is a number ("437000000", "-50.5")
+        """
+        try:
+            float(word)
+            return True
+        except ValueError:
+            return False
+
+    def entry(self, command):
+        """
+        Returns the counters of a command, creating them the first time, has to be called with the lock held
+        """
+        name = self.commandName(command)
+        if name not in self.commands:
+            self.commands[name] = {
+                "count": 0,
+                "errors": 0,
+                "timeouts": 0,
+                "late": 0,
+                "bytes_sent": 0,
+                "bytes_received": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "histogram": [0] * (len(self.BUCKETS_MS) + 1),
+            }
+        return self.commands[name]
+
+    def record(self, command, latency, bytes_sent, bytes_received):
+        """
+        Records a command that got its reply, latency is in seconds
+        """
+        latency_ms = latency * 1000
+        bucket = next((i for i, limit in enumerate(self.BUCKETS_MS) if latency_ms <= limit), len(self.BUCKETS_MS))
+
+        with self.lock:
+            entry = self.entry(command)
+            entry["count"] += 1
+            entry["bytes_sent"] += bytes_sent
+            entry["bytes_received"] += bytes_received
+            entry["total_ms"] += latency_ms
+            entry["max_ms"] = max(entry["max_ms"], latency_ms)
+            entry["histogram"][bucket] += 1
+
+    def recordError(self, command, timeout=False):
+        """
+        Records a command that did not get its reply
+        """
+        with self.lock:
+            entry = self.entry(command)
+            entry["errors"] += 1
+            if timeout:
+                entry["timeouts"] += 1
+
+    def recordLate(self, command):
+        """
+        Records a command whose reply did not arrive before the deadline of its exchange
+        the connection is still fine, the reply is read and thrown away later
+        """
+        with self.lock:
+            self.entry(command)["late"] += 1
+
+    def percentile(self, histogram, count, fraction):
+        """
+        Estimates a latency percentile from the histogram, returns the upper bound of the bucket it falls in
+        """
+        target = count * fraction
+        seen = 0
+        for limit, amount in zip(self.BUCKETS_MS + (None,), histogram):
+            seen += amount
+            if seen >= target:
+                return limit if limit is not None else float("inf")
+        return 0.0
+
+    def summary(self):
+        """
+        Returns the stats as a dictionary that can be sent over xmlrpc (string keys, no None)
+        """
+        labels = [f"<={limit}ms" for limit in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}ms"]
+
+        with self.lock:
+            summary = {}
+            for name, entry in self.commands.items():
+                count = entry["count"]
+                summary[name] = {
+                    "count": count,
+                    "errors": entry["errors"],
+                    "timeouts": entry["timeouts"],
+                    "late": entry["late"],
+                    "bytes_sent": entry["bytes_sent"],
+                    "bytes_received": entry["bytes_received"],
+                    "mean_ms": entry["total_ms"] / count if count else 0.0,
+                    "max_ms": entry["max_ms"],
+                    "p50_ms": self.percentile(entry["histogram"], count, 0.5) if count else 0.0,
+                    "p99_ms": self.percentile(entry["histogram"], count, 0.99) if count else 0.0,
+                    "histogram": dict(zip(labels, entry["histogram"])),
+                }
+            return summary
+
+
+class DeviceDriver(ABC):
+    """
+    Base class for the device drivers.
+    The config keys are looked up with the given prefix, for example with prefix "gqrx":
+        gqrx_ip, gqrx_port                  - address of the device
+        gqrx_rpc_host, gqrx_rpc_port        - address of the xmlrpc server
+        gqrx_timeout                        - seconds a command can take before the connection is considered lost
+        gqrx_health_interval                - an idle connection is checked this often, in seconds
+        gqrx_reconnect_min_delay / max      - the delay between reconnect attempts doubles from min to max
+
+    The connection is watched by a background thread, when it is lost the thread reconnects with an exponential backoff.
+    Calls made while disconnected fail right away instead of hanging.
+
+    Subclasses implement healthCheck and register their own functions in registerFunctions
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.set_logging_level(logging.INFO)
+
+        # load the configuration class
+        self.config = ConfigParser()
+        self.config.loadConfig()
+
+        self.device_ip = self.config.get(f"{prefix}_ip")
+        self.device_port = self.config.get(f"{prefix}_port")
+
+        self.socket = None
+        self.protocol = None      # splits the replies from the device into lines and matches them to the commands
+        self.isConnected = False
+        self.stats = CommandStats()
+
+        # connection supervision
+        self.timeout = self.config.get(f"{prefix}_timeout")
+        self.health_interval = self.config.get(f"{prefix}_health_interval")
+        self.reconnect_min_delay = self.config.get(f"{prefix}_reconnect_min_delay")
+        self.reconnect_max_delay = self.config.get(f"{prefix}_reconnect_max_delay")
+        self.last_success = 0             # time of the last command that got a reply
+        self.connection_event = threading.Event()    # set when the connection is lost, wakes up the supervisor
+        self.stop_event = threading.Event()
+        self.supervisor = None
+
+        self.server = create_rpc_server(self.config.get(f"{prefix}_rpc_host"), self.config.get(f"{prefix}_rpc_port"), self.config.get("rpc_server_mode"), self.config.get("rpc_pool_size"), self.config.get("rpc_transport"), self.config.get("rpc_unix_folder"), self.config.get("rpc_keepalive_timeout"))
+        self.registerFunctions()
+
+    def set_logging_level(self, level):
+        """
+        Sets the logging level. Level can be logging.DEBUG, logging.INFO, etc.
+        """
+        logging.basicConfig(
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
+        self.logger.setLevel(level)
+
+    def registerFunctions(self):
+        """
+        Register the functions available to the server, subclasses add their own
+        """
+        self.server.register_function(self.get_stats)
+
+    def get_stats(self):
+        """
+        Returns the timing stats of every command sent to the device
+        this function is exposed to the outside world via xmlrpc
+        """
+        return self.stats.summary()
+
+    def startConnection(self):
+        """
+        Will start a connection to the device
+        """
+        try:
+            self.socket = socket.create_connection((self.device_ip, self.device_port), timeout=self.timeout)
+            self.protocol = LineProtocol(self.socket, self.stats, late_reply=self.lateReply)
+            self.isConnected = True
+            self.last_success = time.time()
+            self.logger.info(f"Connected to {self.device_ip}:{self.device_port}")
+            return True
+        except Exception as e:
+            self.logger.error(f"Could not connect to {self.device_ip}:{self.device_port}: {e}")
+            self.isConnected = False
+            return False
+
+    def lateReply(self, command, lines):
+        """
+        Called with the reply to a command that arrived after its exchange gave up on it (see LineProtocol.discardPending)
+        the reply is thrown away, subclasses that cache what they read override it
+        """
+        self.logger.debug(f"Discarding late reply to {command}: {lines}")
+
+    def stopConnection(self):
+        """
+        Will stop the connection to the device, and the supervisor with it
+        """
+        try:
+            self.stop_event.set()
+            self.connection_event.set()
+            self.isConnected = False
+            self.socket.close()
+            return True
+        except Exception as e:
+            self.logger.error(f"Error in stopConnection: {e}")
+            return False
+
+    def connectionLost(self, error, protocol):
+        """
+        Called when a command fails because of the connection, the supervisor will reconnect
+        protocol is the one the command used, if it is not the current one the connection was already replaced
+        """
+        if not self.isConnected or protocol is not self.protocol:
+            return
+
+        self.logger.warning(f"Lost connection to {self.device_ip}:{self.device_port}: {error}")
+        self.isConnected = False
+        try:
+            self.socket.close()
+        except Exception:
+            pass
+        self.connection_event.set()
+
+    def startSupervisor(self):
+        """
+        Starts the thread that keeps the connection alive
+        """
+        self.stop_event.clear()
+        self.supervisor = threading.Thread(target=self.superviseConnection, name=f"{self.__class__.__name__}Supervisor", daemon=True)
+        self.supervisor.start()
+
+    def superviseConnection(self):
+        """
+        Reconnects when the connection is down, with a delay that doubles after every failed attempt
+        and checks a connection that has been idle for longer than health_interval
+        """
+        delay = self.reconnect_min_delay
+
+        while not self.stop_event.is_set():
+            if not self.isConnected:
+                if self.startConnection():
+                    delay = self.reconnect_min_delay
+                    continue
+
+                self.logger.info(f"Retrying in {delay}s")
+                self.stop_event.wait(delay)
+                delay = min(delay * 2, self.reconnect_max_delay)
+                continue
+
+            # wait until the connection is lost or it is time for a health check
+            self.connection_event.wait(self.health_interval)
+            self.connection_event.clear()
+
+            if self.isConnected and time.time() - self.last_success >= self.health_interval:
+                try:
+                    self.healthCheck()
+                except Exception as e:
+                    self.logger.debug(f"Health check failed: {e}")
+
+    @abstractmethod
+    def healthCheck(self):
+        """
+        Sends a harmless command to the device, a failure marks the connection as lost
+        every driver has its own, the command depends on the device
+        """
+
+    def pipeline(self, commands, deadline=None):
+        """
+        Sends all the (command, reply_lines) in one batch and returns the lines of each reply
+        raises ConnectionError when not connected, connection errors and timeouts also mark the connection as lost
+        with a deadline (a time.perf_counter() value) the replies that did not arrive in time are None, see LineProtocol.pipeline
+        """
+        protocol = self.protocol
+        if not self.isConnected or protocol is None:
+            raise ConnectionError(f"Not connected to {self.prefix}")
+
+        try:
+            replies = protocol.pipeline(commands, deadline)
+        except OSError as e:
+            # includes timeouts and closed connections
+            self.connectionLost(e, protocol)
+            raise
+
+        if any(reply is not None for reply in replies):
+            self.last_success = time.time()
+        return replies
+
+    def request(self, command, reply_lines=1):
+        """
+        Sends a single command and returns the lines of its reply, see pipeline
+        """
+        return self.pipeline([(command, reply_lines)])[0]
+
+    def startServices(self):
+        """
+        Starts the background threads of the driver, subclasses add their own
+        """
+        self.startSupervisor()
+
+    def main(self):
+        """
+        This is the class that will be used for the code to run itself
+        """
+        self.startConnection()
+        self.startServices()
+        self.server.serve_forever()
@@ -0,0 +1,196 @@
+"""
+The idea of this file is a lighter rpc transport than xmlrpc, for the calls between the ui, the manager, gqrx and rotctl
+Every xmlrpc call opens a new tcp connection, encodes the call as xml and parses an http request and reply.
+Here the client keeps one connection open and each message is a 4 byte big endian length followed by utf-8 json:
+    request  {"method": name, "params": [...]}
+    reply    {"result": value} or {"error": message}
+json can send None, so the functions can return a missing value as None when the whole system uses this transport.
+
+The connection is either tcp (host, port) or a unix domain socket next to rpc_unix_folder, which skips the tcp stack
+when everything runs on the same machine. The server keeps the register_function / serve_forever interface of
+SimpleXMLRPCServer, so the modules register the same functions with the same names whatever the transport.
+"""
+
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import xmlrpc.client
+
+
+HEADER = struct.Struct(">I")
+MAX_MESSAGE = 64 * 1024 * 1024     # a longer length means the stream is out of sync
+
+
+def unix_socket_path(folder, port):
+    """
+    Path of the unix socket of a service, the port keeps the services apart
+    """
+    return os.path.join(folder, f"logbook_{port}.sock")
+
+
+def send_message(sock, message):
+    """
+    Sends a message as length and json in a single write
+    """
+    payload = json.dumps(message, separators=(",", ":"), default=str).encode()
+    sock.sendall(HEADER.pack(len(payload)) + payload)
+
+
+def receive_exactly(sock, count):
+    """
+    Reads count bytes, raises ConnectionError when the other side closed the connection
+    """
+    data = bytearray()
+    while len(data) < count:
+        chunk = sock.recv(count - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        data += chunk
+    return bytes(data)
+
+
+def receive_message(sock):
+    """
+    Reads a single message
+    """
+    length, = HEADER.unpack(receive_exactly(sock, HEADER.size))
+    if length > MAX_MESSAGE:
+        raise ConnectionError(f"Message of {length} bytes, the stream is out of sync")
+    return json.loads(receive_exactly(sock, length))
+
+
+class FastRPCHandler(socketserver.BaseRequestHandler):
+    """
+    Answers the calls of a single connection until the client closes it
+    """
+
+    def handle(self):
+        sock = self.request
+        if sock.family != socket.AF_UNIX:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        while True:
+            try:
+                request = receive_message(sock)
+            except (ConnectionError, OSError, ValueError):
+                return
+
+            send_message(sock, self.server.dispatch(request.get("method"), request.get("params", [])))
+
+
+class FastRPCServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """
+    Serves every connection on its own thread, the clients keep their connection for the whole session
+    so there is a thread per client and not per call
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        self.funcs = {}
+        super().__init__(address, FastRPCHandler)
+
+    def register_function(self, function, name=None):
+        """
+        Same as SimpleXMLRPCServer.register_function
+        """
+        self.funcs[name or function.__name__] = function
+        return function
+
+    def dispatch(self, method, params):
+        """
+        Calls a registered function and returns the reply message
+        """
+        function = self.funcs.get(method)
+        if function is None:
+            return {"error": f'method "{method}" is not supported'}
+        try:
+            return {"result": function(*params)}
+        except Exception as e:
+            return {"error": f"{type(e).__name__}: {e}"}
+
+
+class UnixFastRPCServer(FastRPCServer):
+    """
+    Same server on a unix domain socket, an old socket file left behind by a crash is removed first
+    """
+    address_family = socket.AF_UNIX
+    allow_reuse_address = False
+
+    def __init__(self, path):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+class FastRPCProxy:
+    """
+    Client side, used like a ServerProxy: proxy.get_radio_info()
+    The connection is opened on the first call and kept, a call on a broken connection reconnects once.
+    A failed call raises xmlrpc.client.Fault, so the callers handle both transports the same way.
+    Calls from several threads are sent one at a time over the same connection
+    """
+
+    def __init__(self, address, timeout=None):
+        """
+        address is (host, port) for tcp or the path of a unix socket
+        """
+        self.__address = address
+        self.__timeout = timeout
+        self.__socket = None
+        self.__lock = threading.Lock()
+
+    def __connect(self):
+        if isinstance(self.__address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.__timeout)
+            sock.connect(self.__address)
+        else:
+            sock = socket.create_connection(self.__address, self.__timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def __close(self):
+        if self.__socket is not None:
+            self.__socket.close()
+            self.__socket = None
+
+    def __call(self, method, params):
+        with self.__lock:
+            for attempt in range(2):
+                # a connection that the server closed while we were idle only shows up on the next call
+                reused = self.__socket is not None
+                if not reused:
+                    self.__socket = self.__connect()
+                try:
+                    send_message(self.__socket, {"method": method, "params": params})
+                    reply = receive_message(self.__socket)
+                    break
+                except (ConnectionError, OSError) as e:
+                    self.__close()
+                    if not reused or isinstance(e, socket.timeout):
+                        raise
+                except ValueError:
+                    self.__close()
+                    raise
+
+        if "error" in reply:
+            raise xmlrpc.client.Fault(1, reply["error"])
+        return reply.get("result")
+
+    def close(self):
+        with self.__lock:
+            self.__close()
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return lambda *params: self.__call(name, list(params))
@@ -1,9 +1,9 @@
-from xmlrpc.server import SimpleXMLRPCServer
 
-import socket
+import threading
 import time
 
-from config_parser import ConfigParser
+from device_driver import DeviceDriver
+from telemetry import TelemetrySampler
 
 """
 The idea of this file is to create a class that will handle the connection and communication with gqrx
@@ -11,73 +11,149 @@ It will allow to easily send commands to send and recevie commands from the gqrx
 """
 
 
-class Gqrx:
+class Gqrx(DeviceDriver):
+    """
+    Class that will handle the connection and interface with gqrx
+    The connection handling (timeouts, reconnecting, health checks) comes from DeviceDriver
+    """
+    
+    # the query commands that make up a radio snapshot
+    # name : (command, number of lines in the reply, parser for the first line)
+    # the name is also the key used in the dictionary returned by get_radio_info
+    QUERY_COMMANDS = {
+        "dbfs": ("l STRENGTH", 1, float),
+        "frequency": ("f", 1, float),
+        "demodulator_mode": ("m", 2, str),     # gqrx replies with the mode and the passband
+        "squelch_threshold": ("l SQL", 1, float),
+        "iqrecording_status": ("u IQRECORD", 1, lambda value: bool(int(value))),
+        "gain": ("l PGA_GAIN GAIN", 1, str),
+    }
     
     def __init__(self):
         """
-        Receives host list and port list, the order is [gqrx, rpc_server]
+        Everything is loaded from the config file, the keys start with gqrx_
         """
+        super().__init__("gqrx")
         
-        # load the configuration class
-        self.config = ConfigParser()
-        self.config.loadConfig()
+        # pipelined sends every query in one batch, serial sends them one at a time
+        self.snapshot_mode = self.config.get("gqrx_snapshot_mode")
+        # get_radio_info gives up on the fields that are not read within this many seconds (0 waits for all of them)
+        self.snapshot_budget = self.config.get("gqrx_snapshot_budget")
         
-        self.gqrx_ip = self.config.get("gqrx_ip")
-        self.gqrx_port = self.config.get("gqrx_port")
+        # fields that rarely change (mode, squelch, gain) are only read again after cache_ttl seconds
+        # the fields in uncached_fields are always read, set commands expire the fields they change
+        self.cache_ttl = self.config.get("gqrx_cache_ttl")
+        self.uncached_fields = self.config.get("gqrx_uncached_fields")
         
-        self.socket = None
-        self.isConnected = True
-    
-        self.server = SimpleXMLRPCServer((self.config.get('gqrx_rpc_host'), self.config.get('gqrx_rpc_port')))
-        self.registerFunctions()
+        # last value read for every field and when it was read, name : (time, value)
+        # it is the cache, and also what is used for the fields that do not make it within the budget
+        self.last_known = {}
+        # bumped by expire, a value read before the last expire of its field is not stored, see remember
+        self.generations = {}
+        self.cache_lock = threading.Lock()
+        # fields whose reply did not make it within the budget, name : readStamp of the read they were sent in
+        # the reply is still read at the start of the next exchange, and stored in the cache then, see lateReply
+        self.late_reads = {}
+        self.field_names = {command: name for name, (command, _, _) in self.QUERY_COMMANDS.items()}
+        
+        # table of the get methods that make up a snapshot, built once instead of on every call
+        self.query_table = self.buildQueryTable()
+        
+        # samples the radio in the background so that events do not have to wait on gqrx
+        self.sampler = TelemetrySampler("Gqrx", self.sample_radio_info, self.config.get("gqrx_sample_rate"), self.config.get("telemetry_buffer_size"))
+        self.max_sample_age = self.config.get("telemetry_max_age")
     
     def registerFunctions(self):
         """
         Register the functions available to the server
         """
-        # for now i am only exposing this function
-        # but in the future i should expose other functions as well
+        super().registerFunctions()
         self.server.register_function(self.get_radio_info)
+        self.server.register_function(self.get_radio_info_at)
+        self.server.register_function(self.get_field_history)
         self.server.register_function(self.start_iq_recording)
         self.server.register_function(self.stop_iq_recording)
         
-    def startConnection(self):
+    def buildQueryTable(self):
         """
-        Will start a connection to the gqrx server
+        Finds the get method of every field in QUERY_COMMANDS
+        returns a dictionary with the name of the field and the bound method
         """
-        try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.gqrx_ip, self.gqrx_port))
-            self.isConnected = True
-            return True
-        except Exception as e:
-            print("Error in startConnection: ", e)
-            self.isConnected = False
-            return False
+        return {name: getattr(self, f"get_{name}") for name in self.QUERY_COMMANDS}
     
-    def stopConnection(self):
+    def query(self, name):
         """
-        Will stop the connection to the gqrx server
+        Will send the query command with the given name and parse the reply
+        the cached value is returned instead while it is fresh
         """
-        try:
-            self.socket.close()
-            self.isConnected = False
-            return True
-        except Exception as e:
-            print("Error in stopConnection: ", e)
+        if self.isCached(name):
+            return self.last_known[name][1]
+        
+        command, reply_lines, parser = self.QUERY_COMMANDS[name]
+        read_time, generations = self.readStamp([name])
+        value = parser(self.request(command, reply_lines)[0])
+        self.remember(name, value, read_time, generations[name])
+        return value
+    
+    def isCached(self, name):
+        """
+        True when the last value read for the field can be used instead of asking gqrx
+        """
+        if not self.cache_ttl or name in self.uncached_fields or name not in self.last_known:
             return False
-
+        return time.time() - self.last_known[name][0] <= self.cache_ttl
+    
+    def expire(self, name):
+        """
+        Called after a command that changes the field, the next read goes to gqrx
+        the value is kept, it is still the best guess if the next read does not make it within the budget
+        """
+        with self.cache_lock:
+            self.generations[name] = self.generations.get(name, 0) + 1
+            if name in self.last_known:
+                self.last_known[name] = (0, self.last_known[name][1])
+    
+    def readStamp(self, names):
+        """
+        Taken before the fields are sent to gqrx, returns the time and the generation of every field
+        """
+        with self.cache_lock:
+            return time.time(), {name: self.generations.get(name, 0) for name in names}
+    
+    def remember(self, name, value, read_time, generation):
+        """
+        Stores a value read from gqrx as the last known one, stamped with the time the read was sent
+        a read sent before the field was expired may hold the value from before the set, it is not stored
+        """
+        with self.cache_lock:
+            if self.generations.get(name, 0) == generation:
+                self.last_known[name] = (read_time, value)
+    
+    def lateReply(self, command, lines):
+        """
+        Stores the reply to a query that arrived after the budget of its snapshot as the last known value
+        a field that was read again in the meantime keeps the newer value
+        """
+        name = self.field_names.get(command)
+        with self.cache_lock:
+            stamp = self.late_reads.pop(name, None)
+        if stamp is None:
+            return super().lateReply(command, lines)
+        
+        read_time, generation = stamp
+        if name in self.last_known and self.last_known[name][0] > read_time:
+            return
+        self.remember(name, self.QUERY_COMMANDS[name][2](lines[0]), read_time, generation)
+        self.logger.debug(f"Stored late reply to {command}: {lines}")
+    
     def get_dbfs(self):
         """
         Will get the dbfs value from the gqrx server
         """
         try:
-            self.socket.send("l STRENGTH\n".encode())
-            data = self.socket.recv(1024)
-            print("Data: ", data)
-            return float(data.decode())
+            return self.query("dbfs")
         except Exception as E:
-            print("Error getting dbfs: ", E)
+            self.logger.error(f"Error getting dbfs: {E}")
             return None
     
     def get_frequency(self):
@@ -85,11 +161,9 @@ class Gqrx:
         Will get the frequency value from the gqrx server
         """
         try:
-            self.socket.send("f\n".encode())
-            data = self.socket.recv(1024)
-            return float(data.decode())
+            return self.query("frequency")
         except Exception as E:
-            print("Error getting frequency: ", E)
+            self.logger.error(f"Error getting frequency: {E}")
             return None
     
     def get_demodulator_mode(self):
@@ -97,11 +171,9 @@ class Gqrx:
         Will get the demodulator mode from the gqrx server
         """
         try:
-            self.socket.send("m\n".encode())
-            data = self.socket.recv(1024)
-            return data.decode()
+            return self.query("demodulator_mode")
         except Exception as E:
-            print("Error getting demodulator mode: ", E)
+            self.logger.error(f"Error getting demodulator mode: {E}")
             return None
     
     def get_squelch_threshold(self):
@@ -109,11 +181,9 @@ class Gqrx:
         Will get the squelch threshold from the gqrx server
         """
         try:
-            self.socket.send("l SQL\n".encode())
-            data = self.socket.recv(1024)
-            return float(data.decode())
+            return self.query("squelch_threshold")
         except Exception as E:
-            print("Error getting squelch threshold: ", E)
+            self.logger.error(f"Error getting squelch threshold: {E}")
             return None
         
     def get_iqrecording_status(self):
@@ -122,11 +192,9 @@ class Gqrx:
         """
         
         try:
-            self.socket.send("u IQRECORD\n".encode())
-            data = self.socket.recv(1024)
-            return bool(int(data.decode()))
+            return self.query("iqrecording_status")
         except Exception as E:
-            print("Error getting iq recording status: ", E)
+            self.logger.error(f"Error getting iq recording status: {E}")
             return None
     
 
@@ -135,31 +203,127 @@ class Gqrx:
         Will get the gain from the gqrx server
         """
         try:
-            self.socket.send("l PGA_GAIN GAIN\n".encode())
-            data = self.socket.recv(1024)
-            return data.decode()
+            return self.query("gain")
         except Exception as E:
-            print("Error getting gain: ", E)
+            self.logger.error(f"Error getting gain: {E}")
             return None
+    
+    def get_radio_snapshot(self, deadline=None):
+        """
+        Will write all the query commands to gqrx in a single batch and then read the replies back in order
+        this way the whole snapshot costs one round trip instead of one per command
+        """
+        names = [name for name in self.query_table if not self.isCached(name)]
+        stamp = self.readStamp(names)
+        replies = self.pipeline([self.QUERY_COMMANDS[name][:2] for name in names], deadline) if names else []
+        
+        return self.buildSnapshot(names, replies, stamp)
+    
+    def buildSnapshot(self, names, replies, stamp):
+        """
+        Parses the replies of the fields that were read into the snapshot dictionary and remembers them as the last known values
+        the fields that were not read come from the cache, fields without a reply (None) take their last known value
+        and are listed in "stale_fields", fields that were never read are left out.
+        xmlrpc can not send None, so the list is a comma separated string
+        stamp is the readStamp taken before the fields were sent
+        """
+        read_time, generations = stamp
+        replies = dict(zip(names, replies))
+        response_dict = {}
+        stale = []
+        for name in self.query_table:
+            if name not in replies:
+                response_dict[name] = self.last_known[name][1]
+                continue
+            
+            try:
+                if replies[name] is None:
+                    # the reply may still arrive, it is stored by lateReply then
+                    with self.cache_lock:
+                        self.late_reads[name] = (read_time, generations[name])
+                    raise ValueError("no reply")
+                value = self.QUERY_COMMANDS[name][2](replies[name][0])
+            except ValueError:
+                # late or unexpected reply (RPRT 1 for example)
+                stale.append(name)
+                if name in self.last_known:
+                    response_dict[name] = self.last_known[name][1]
+                continue
+            
+            self.remember(name, value, read_time, generations[name])
+            response_dict[name] = value
+        
+        if stale:
+            response_dict["stale_fields"] = ",".join(stale)
+        return response_dict
+        
+    def sample_radio_info(self, deadline=None):
+        """
+        Will read every field of the snapshot and return the data as a dictionary
+        used both by get_radio_info and by the background sampler
+        deadline is a time.perf_counter() value, the fields not read by then are marked as stale
+        """
+        if self.snapshot_mode == "pipelined":
+            return self.get_radio_snapshot(deadline)
+        
+        names = [name for name in self.query_table if not self.isCached(name)]
+        stamp = self.readStamp(names)
+        replies = []
+        for name in names:
+            if deadline is not None and time.perf_counter() >= deadline:
+                replies.append(None)
+                continue
+            replies.append(self.pipeline([self.QUERY_COMMANDS[name][:2]], deadline)[0])
+        return self.buildSnapshot(names, replies, stamp)
         
     def get_radio_info(self):
         """
-        General function that will call all available get methods and return the data as a dictionary
+        General function that will read every field and return the data as a dictionary
+        it never takes much longer than the snapshot budget, the fields that were too slow are marked as stale
         this function is exposed to the outside world via xmlrpc
         """
-        print("Getting radio info")
-        function_list = [f for f in dir(self) if callable(getattr(self, f)) and f.startswith("get_") and f != "get_radio_info"]
+        self.logger.debug("Getting radio info")
         
+        deadline = time.perf_counter() + self.snapshot_budget if self.snapshot_budget else None
         try:
-            response_dict = {}
-            for f in function_list:
-                variable_name = f.split("get_")[1]
-                response_dict[variable_name] = getattr(self, f)()
-            print("  Radio info: ", response_dict)
+            response_dict = self.sample_radio_info(deadline)
+            self.logger.debug(f"  Radio info: {response_dict}")
             return response_dict
         except Exception as E:
-            print("Error getting radio info: ", E)
-            return {}
+            self.logger.error(f"Error getting radio info: {E}")
+            # whatever was known before gqrx failed, all stale
+            names = [name for name in self.query_table if not self.isCached(name)]
+            return self.buildSnapshot(names, [None] * len(names), self.readStamp(names))
+        
+    def get_radio_info_at(self, timestamp):
+        """
+        Returns the radio info at the given unix timestamp, taken from the background samples
+        if there is no sample close enough to the timestamp it will query gqrx directly
+        "sample_age" is how many seconds the sample (or the direct query) is away from the timestamp
+        this function is exposed to the outside world via xmlrpc
+        """
+        response_dict, sample_time = self.sampler.at(timestamp, self.max_sample_age)
+        if response_dict is None:
+            self.logger.info("No recent radio sample, querying gqrx")
+            response_dict = self.get_radio_info()
+            sample_time = time.time()
+        
+        response_dict["sample_age"] = abs(sample_time - timestamp)
+        return response_dict
+        
+    def get_field_history(self, field, since):
+        """
+        Returns the values of a field sampled in the background after the unix timestamp since,
+        as {"times": [...], "values": [...]}. It only reads the stored samples, so it adds no load on gqrx
+        this function is exposed to the outside world via xmlrpc
+        """
+        times, samples = self.sampler.since(since)
+        history = {"times": [], "values": []}
+        for timestamp, sample in zip(times, samples):
+            if sample.get(field) is not None:
+                history["times"].append(timestamp)
+                history["values"].append(sample[field])
+        return history
         
     def set_radio_frequency(self, frequency):
         """
@@ -167,56 +331,63 @@ class Gqrx:
         """
         
         try:
-            self.socket.send(f"F {frequency}\n".encode())
-            data = self.socket.recv(1024)
-            print("Reponse: ", data)
+            data = self.request(f"F {frequency}")[0]
+            self.logger.debug(f"Reponse: {data}")
             return True
         except Exception as E:
-            print("Error setting frequency: ", E)
+            self.logger.error(f"Error setting frequency: {E}")
             return False
+        finally:
+            # whatever the reply, the cached frequency can not be trusted anymore
+            self.expire("frequency")
         
     def start_iq_recording(self):
         """
         Will start the recording of the IQ data
         """
-        print("Will start IQ recording")
+        self.logger.info("Will start IQ recording")
         try:
-            self.socket.send("U IQRECORD 1\n".encode())
-            data = self.socket.recv(1024)
-            print("Reponse: ", data)
+            data = self.request("U IQRECORD 1")[0]
+            self.logger.debug(f"Reponse: {data}")
             return True
         except Exception as E:
-            print("Error starting IQ recording: ", E)
+            self.logger.error(f"Error starting IQ recording: {E}")
             return False
+        finally:
+            # whatever the reply, the cached iqrecording_status can not be trusted anymore
+            self.expire("iqrecording_status")
     
     def stop_iq_recording(self):
         """
         Will stop the recording of the IQ data
         """
-        print("Will stop IQ recording")
+        self.logger.info("Will stop IQ recording")
         try:
-            self.socket.send("U IQRECORD 0\n".encode())
-            data = self.socket.recv(1024)
-            print("Reponse: ", data)
+            data = self.request("U IQRECORD 0")[0]
+            self.logger.debug(f"Reponse: {data}")
             return True
         except Exception as E:
-            print("Error stopping IQ recording: ", E)
+            self.logger.error(f"Error stopping IQ recording: {E}")
             return False
+        finally:
+            # whatever the reply, the cached iqrecording_status can not be trusted anymore
+            self.expire("iqrecording_status")
 
-    def main(self):
+    def startServices(self):
         """
-        This is the class that will be used for the code to run itself
+        Starts the connection supervisor and the background sampler
         """
-        self.startConnection()
-        self.server.serve_forever()
+        super().startServices()
+        self.sampler.start()
+    
+    def healthCheck(self):
+        """
+        Reading the frequency is harmless, a failure marks the connection as lost
+        """
+        self.query("frequency")
 
     
 if __name__ == "__main__":
     
     my_gqrx = Gqrx()
-    my_gqrx.startConnection()
-    
-
-    # my_gqrx.get_dbfs()    
-
-    my_gqrx.server.serve_forever()
\ No newline at end of file
+    my_gqrx.main()
\ No newline at end of file
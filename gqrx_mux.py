@@ -0,0 +1,332 @@
+"""
+The idea of this file is to get around gqrx accepting only one remote control socket
+The mux owns the single connection to gqrx and accepts as many clients as needed (gpredict, gqrx_control, ...)
+on its own port, that speaks the same line protocol as gqrx.
+
+    - the commands of every client are queued and sent to gqrx in rounds, taking a few commands from each client in turn,
+      so gpredict sending doppler corrections as fast as it can does not starve the metadata queries
+    - frequency sets that are replaced by a newer one before they were sent, or that set the frequency gqrx is already on,
+      are answered right away and never reach gqrx
+    - read only queries (f, m, l ..., u ...) are answered from a cache that lives for gqrx_mux_cache_ttl seconds,
+      a set command drops the cached value it changes
+    - commands that are not in GqrxMux.COMMANDS are passed to gqrx as they are and their reply is read up to its RPRT line,
+      since the mux does not know what they change the whole cache is dropped
+
+To use it point gqrx_mux_ip/gqrx_mux_port at gqrx, and gqrx_ip/gqrx_port and gpredict at gqrx_mux_listen_host/gqrx_mux_listen_port
+"""
+
+import socket
+import threading
+import time
+from collections import deque
+
+from device_driver import DeviceDriver
+
+
+class GqrxMux(DeviceDriver):
+    """
+    Multiplexes many remote control clients over the one gqrx connection
+    The connection to gqrx (timeouts, reconnecting, health checks) comes from DeviceDriver
+    """
+
+    # the commands of the gqrx remote control protocol, first word : (kind, lines in the reply)
+    # reads are answered from the cache, sets drop the cached reply of the read they change (see changedRead)
+    # the kind of anything else is None, see the module docstring
+    COMMANDS = {
+        "f": ("read", 1),
+        "m": ("read", 2),       # mode and passband
+        "l": ("read", 1),
+        "u": ("read", 1),
+        "_": ("read", 1),       # version
+        "F": ("set", 1),
+        "M": ("set", 1),
+        "L": ("set", 1),
+        "U": ("set", 1),
+        "AOS": ("set", 1),      # sent by gpredict, gqrx starts and stops the audio recording
+        "LOS": ("set", 1),
+    }
+
+    # kind and reply lines of a command that is not in COMMANDS, the reply is read up to its RPRT line
+    UNKNOWN_COMMAND = (None, None)
+
+    # answer to a command that could not be sent to gqrx, the same gqrx uses for a failed command
+    ERROR_REPLY = ["RPRT 1"]
+
+    def __init__(self):
+        """
+        Everything is loaded from the config file, the keys start with gqrx_mux_
+        """
+        super().__init__("gqrx_mux")
+
+        self.listen_host = self.config.get("gqrx_mux_listen_host")
+        self.listen_port = self.config.get("gqrx_mux_listen_port")
+        self.cache_ttl = self.config.get("gqrx_mux_cache_ttl")
+        self.quantum = self.config.get("gqrx_mux_quantum")     # commands taken from each client per round
+
+        self.clients = []           # dictionaries with the socket, the address and the queue of commands of each client
+        self.next_client = 0        # where the next round starts, so the first client is not always served first
+        self.work = threading.Condition()    # protects clients and their queues, notified when a command is queued
+
+        self.cache = {}             # read command : (time it was read, reply lines)
+        self.cache_lock = threading.Lock()
+
+        self.counters = {"cache_hits": 0, "coalesced_sets": 0, "upstream_commands": 0, "rounds": 0}
+
+        self.listener = None
+
+    def registerFunctions(self):
+        """
+        Register the functions available to the server
+        """
+        super().registerFunctions()
+        self.server.register_function(self.get_mux_stats)
+
+    def get_mux_stats(self):
+        """
+        Returns the number of clients and how many commands were saved by the cache and the coalescing
+        this function is exposed to the outside world via xmlrpc
+        """
+        with self.work:
+            clients = [client["name"] for client in self.clients]
+        return {"clients": clients, **self.counters}
+
+    def healthCheck(self):
+        """
+        Reading the frequency is harmless, a failure marks the connection as lost
+        """
+        self.storeCached("f", self.request("f"))
+
+    def startServices(self):
+        """
+        Starts the connection supervisor, the listener for the clients and the scheduler
+        """
+        super().startServices()
+
+        self.listener = socket.create_server((self.listen_host, self.listen_port))
+        self.logger.info(f"Waiting for clients on {self.listen_host}:{self.listen_port}")
+        threading.Thread(target=self.acceptClients, name="GqrxMuxListener", daemon=True).start()
+        threading.Thread(target=self.schedule, name="GqrxMuxScheduler", daemon=True).start()
+
+    def acceptClients(self):
+        """
+        Accepts new clients and starts a reading thread for each one
+        """
+        while not self.stop_event.is_set():
+            try:
+                client_socket, address = self.listener.accept()
+            except OSError as e:
+                if not self.stop_event.is_set():
+                    self.logger.error(f"Error accepting a client: {e}")
+                continue
+
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = {"socket": client_socket, "name": f"{address[0]}:{address[1]}", "queue": deque()}
+            with self.work:
+                self.clients.append(client)
+            self.logger.info(f"Client {client['name']} connected")
+
+            threading.Thread(target=self.readClient, args=(client,), name=f"GqrxMuxClient {client['name']}", daemon=True).start()
+
+    def readClient(self, client):
+        """
+        Queues every line the client sends, the replies are written by the scheduler
+        """
+        try:
+            with client["socket"].makefile("rb") as client_file:
+                for line in client_file:
+                    command = line.decode(errors="replace").strip()
+                    if not command:
+                        continue
+                    if command in ("q", "c"):
+                        break   # close the connection, this must not reach gqrx or it would close ours
+                    with self.work:
+                        client["queue"].append(command)
+                        self.work.notify()
+        except OSError as e:
+            self.logger.debug(f"Client {client['name']} read failed: {e}")
+
+        with self.work:
+            self.clients.remove(client)
+        client["socket"].close()
+        self.logger.info(f"Client {client['name']} disconnected")
+
+    def schedule(self):
+        """
+        Serves the clients in rounds until the mux is stopped
+        """
+        while not self.stop_event.is_set():
+            with self.work:
+                while not any(client["queue"] for client in self.clients):
+                    self.work.wait()
+                round_commands = self.takeRound()
+
+            self.serveRound(round_commands)
+
+    def takeRound(self):
+        """
+        Takes up to quantum commands from every client, starting one client further every round
+        returns a list of (client, [commands]), has to be called holding self.work
+        """
+        round_commands = []
+        count = len(self.clients)
+        for i in range(count):
+            client = self.clients[(self.next_client + i) % count]
+            commands = []
+            while client["queue"] and len(commands) < self.quantum:
+                commands.append(client["queue"].popleft())
+            if commands:
+                round_commands.append((client, commands))
+
+        self.next_client = (self.next_client + 1) % count if count else 0
+        return round_commands
+
+    def serveRound(self, round_commands):
+        """
+        Answers what can be answered without gqrx, sends everything else in one batch and writes the replies back
+        the batch keeps the order of the commands, so a read that comes after a set sees the new value
+        """
+        replies = {}            # (client position, command position) : reply lines
+        upstream = []           # (command, reply_lines) sent to gqrx, None for a set that was coalesced
+        upstream_keys = []      # where the reply of each upstream command goes, a read asked by several clients is sent once
+        reads = {}              # read command : position in upstream, since the last set
+        last_set = None         # position in upstream of the last frequency set, while nothing has read it yet
+
+        for client_index, (client, commands) in enumerate(round_commands):
+            for command_index, command in enumerate(commands):
+                key = (client_index, command_index)
+                kind, reply_lines = self.COMMANDS.get(command.split()[0], self.UNKNOWN_COMMAND)
+
+                if kind == "read":
+                    cached = self.getCached(command)
+                    if cached is not None:
+                        replies[key] = cached
+                        self.counters["cache_hits"] += 1
+                    elif command in reads:
+                        upstream_keys[reads[command]].append(key)
+                        self.counters["cache_hits"] += 1
+                    else:
+                        reads[command] = len(upstream)
+                        upstream.append((command, reply_lines))
+                        upstream_keys.append([key])
+                        last_set = None
+                    continue
+
+                if command.startswith("F "):
+                    if self.isCurrentFrequency(command):
+                        # gqrx is already there
+                        replies[key] = ["RPRT 0"]
+                        self.counters["coalesced_sets"] += 1
+                        continue
+                    if last_set is not None:
+                        # the older set would be overwritten before anyone read it, only the newest is sent
+                        for old_key in upstream_keys[last_set]:
+                            replies[old_key] = ["RPRT 0"]
+                        upstream[last_set] = None
+                        self.counters["coalesced_sets"] += 1
+                    last_set = len(upstream)
+
+                if kind is None:
+                    # could change anything, a frequency set before it is not replaced by one after it
+                    last_set = None
+
+                # the reads before this set were already answered, the ones after it have to go to gqrx
+                self.updateCache(command, None)
+                reads = {}
+                upstream.append((command, reply_lines))
+                upstream_keys.append([key])
+
+        sent = [(i, command) for i, command in enumerate(upstream) if command is not None]
+        if sent:
+            try:
+                upstream_replies = self.pipeline([command for _, command in sent])
+            except Exception as e:
+                self.logger.warning(f"Could not send {len(sent)} commands to gqrx: {e}")
+                upstream_replies = [self.ERROR_REPLY] * len(sent)
+
+            for (i, (command, _)), lines in zip(sent, upstream_replies):
+                for key in upstream_keys[i]:
+                    replies[key] = lines
+                self.updateCache(command, lines)
+
+        self.counters["upstream_commands"] += len(sent)
+        self.counters["rounds"] += 1
+
+        for client_index, (client, commands) in enumerate(round_commands):
+            reply = "".join(f"{line}\n" for command_index in range(len(commands)) for line in replies[(client_index, command_index)])
+            try:
+                client["socket"].sendall(reply.encode())
+            except OSError as e:
+                self.logger.debug(f"Could not reply to {client['name']}: {e}")
+
+    def getCached(self, command):
+        """
+        Returns the cached reply of a read only command, None when it is not cached or too old
+        """
+        with self.cache_lock:
+            entry = self.cache.get(command)
+        if entry is None or time.time() - entry[0] > self.cache_ttl:
+            return None
+        return entry[1]
+
+    def storeCached(self, command, lines):
+        """
+        Stores the reply of a read only command, error replies are not stored
+        """
+        if lines and not lines[0].startswith("RPRT"):
+            with self.cache_lock:
+                self.cache[command] = (time.time(), lines)
+
+    def updateCache(self, command, lines):
+        """
+        Read only commands store their reply, set commands drop the cached value they changed
+        and unknown commands drop everything
+        """
+        kind = self.COMMANDS.get(command.split()[0], self.UNKNOWN_COMMAND)[0]
+        if kind == "read":
+            self.storeCached(command, lines)
+            return
+
+        with self.cache_lock:
+            if kind is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(self.changedRead(command), None)
+
+    def changedRead(self, command):
+        """
+        The read command whose reply is changed by the given set command
+        F 437000000 changes f, L SQL -50 changes l SQL, M FM 10000 changes m, AOS and LOS change u RECORD
+        """
+        words = command.split()
+        if words[0] in ("AOS", "LOS"):
+            return "u RECORD"
+        if words[0] in ("F", "M"):
+            return words[0].lower()
+        return " ".join([words[0].lower()] + words[1:-1])
+
+    def isCurrentFrequency(self, command):
+        """
+        True when the frequency set by command is the one gqrx is on, according to a fresh cached f
+        """
+        cached = self.getCached("f")
+        try:
+            return cached is not None and float(cached[0]) == float(command.split()[1])
+        except (ValueError, IndexError):
+            return False
+
+    def stopConnection(self):
+        """
+        Stops the connection to gqrx and closes every client
+        """
+        if self.listener is not None:
+            self.listener.close()
+        with self.work:
+            for client in self.clients:
+                client["socket"].close()
+        return super().stopConnection()
+
+
+if __name__ == "__main__":
+
+    my_mux = GqrxMux()
+    my_mux.main()
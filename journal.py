@@ -0,0 +1,120 @@
+"""
+The idea of this file is to write every event of a passage to disk as soon as it happens
+Each record is one compact json object per line, appended to a journal file that stays open during the passage.
+If the program dies in the middle of a passage the journal still has everything up to the last sync,
+and when the passage ends normally the final json is built from it
+"""
+
+import json
+import os
+import threading
+
+
+class EventJournal:
+    """
+    Append only json lines file.
+    Every record is flushed to the os right away, so a crash of the program loses nothing,
+    fsync is only done every fsync_every records, and by a background thread for the records that are still
+    waiting fsync_interval seconds later, so a power loss loses at most that batch.
+    The append itself never waits on the disk unless it completes a batch
+    """
+
+    def __init__(self, file_path, fsync_every=10, fsync_interval=1.0):
+        self.file_path = file_path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+
+        folder = os.path.dirname(file_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.file = open(file_path, "a")
+        if self.endsMidRecord():
+            # the last record was cut by a crash, end it so the next record starts on its own line
+            self.file.write("\n")
+        self.unsynced = 0           # records written since the last fsync
+        self.lock = threading.Lock()    # protects unsynced, append and the background sync run on different threads
+
+        self.stop_event = threading.Event()
+        self.sync_thread = threading.Thread(target=self.syncPeriodically, name="JournalSync", daemon=True)
+        self.sync_thread.start()
+
+    def endsMidRecord(self):
+        """
+        True when the journal already has data and its last line was not finished
+        """
+        if os.path.getsize(self.file_path) == 0:
+            return False
+        with open(self.file_path, "rb") as file:
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) != b"\n"
+
+    def append(self, record):
+        """
+        Writes one record (a dictionary) to the journal
+        """
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            self.unsynced += 1
+
+            if self.unsynced >= self.fsync_every:
+                self.syncLocked()
+
+    def sync(self):
+        """
+        Forces everything written so far to the disk
+        """
+        with self.lock:
+            self.syncLocked()
+
+    def syncLocked(self):
+        """
+        Same as sync, has to be called holding self.lock
+        """
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+
+    def syncPeriodically(self):
+        """
+        Background loop, syncs the records of a batch that is not full yet every fsync_interval seconds
+        """
+        while not self.stop_event.wait(self.fsync_interval):
+            with self.lock:
+                if self.unsynced and not self.file.closed:
+                    self.syncLocked()
+
+    def close(self):
+        """
+        Syncs and closes the journal, the file is kept
+        """
+        self.stop_event.set()
+        with self.lock:
+            if self.file.closed:
+                return
+            self.syncLocked()
+            self.file.close()
+
+    def remove(self):
+        """
+        Closes and deletes the journal, to be used once the passage was dumped
+        """
+        self.close()
+        os.remove(self.file_path)
+
+
+def read_journal(file_path):
+    """
+    Yields the records of a journal one by one
+    A last line that was only partially written (the program died while writing it) is skipped
+    """
+    with open(file_path, "r") as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Skipping damaged record on line {line_number} of {file_path}")
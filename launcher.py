@@ -1,9 +1,10 @@
 import importlib
-import inspect
 import logging
+import multiprocessing
 import threading
 import signal
 import sys
+import time
 from config_parser import ConfigParser
 
 class Launcher:
@@ -25,6 +26,22 @@ class Launcher:
 
         # List to keep track of active threads
         self.threads = []
+        
+        # thread runs every module as a thread of this process, process runs each one in its own supervised process
+        self.launch_mode = self.config.get("launch_mode")
+        self.restart_min_delay = self.config.get("launch_restart_min_delay")
+        self.restart_max_delay = self.config.get("launch_restart_max_delay")
+        self.stop_timeout = self.config.get("launch_stop_timeout")
+        
+        # module name : {"process", "started", "delay", "restart_at"} in process mode
+        self.processes = {}
+        self.stop_event = threading.Event()
+        
+        # every module sets its event once its class was built (its rpc server is bound), the modules that
+        # depend on it (<module>_depends_on in the config) are only launched after that
+        self.ready_timeout = self.config.get("launch_ready_timeout")
+        self.ready_events = {}
+        self.launch_start = time.perf_counter()
     
     def set_logging_level(self, level):
         """
@@ -37,19 +54,19 @@ class Launcher:
         self.logger.setLevel(level)
         self.logger.info(f"Logging level set to {logging.getLevelName(level)}")
     
-    def launch_single_module(self, module_name):
+    def launch_single_module(self, module_name, ready_event=None):
         """
         Given a module name, this method will dynamically import and launch it.
         module_name is the name of the file that contains the class/function to be launched.
+        ready_event is set once the class was built, before its main function runs
         """
         try:
             # Dynamically import the module
             module = importlib.import_module(module_name)
             self.logger.info(f"Launching: {module_name}")
 
-            # Get the list of classes defined in the module
-            classes = inspect.getmembers(module, inspect.isclass)
-            module_classes = [cls for cls_name, cls in classes if cls.__module__ == module_name]
+            # Get the list of classes defined in the module, vars is enough, no need to sort every member like inspect does
+            module_classes = [cls for cls in vars(module).values() if isinstance(cls, type) and cls.__module__ == module_name]
             self.logger.debug(f"Classes found in module {module_name}: {module_classes}")
 
             # Check for ambiguity or absence of classes
@@ -62,6 +79,10 @@ class Launcher:
         
             # Instantiate the first class found
             module_instance = module_classes[0]()
+            
+            # the servers are bound in the constructors, so the modules that depend on this one can start
+            if ready_event is not None:
+                ready_event.set()
 
             # If the module has a main function or a specific function to run, you can call it here
             if hasattr(module_instance, 'main'):
@@ -81,10 +102,15 @@ class Launcher:
         """
         Orchestrates the launching of all modules in the modules_list by creating a thread for each module.
         Handles graceful shutdown when Ctrl+C (SIGINT) is received.
+        With launch_mode process every module runs in its own process instead, see orchestrate_processes
         """
+        if self.launch_mode == "process":
+            return self.orchestrate_processes()
+        
         def launch_thread(module_name):
             try:
-                self.launch_single_module(module_name)
+                self.wait_for_dependencies(module_name)
+                self.launch_single_module(module_name, self.ready_events[module_name])
             except Exception as e:
                 self.logger.error(f"Failed to launch module {module_name}. Error: {e}")
 
@@ -100,7 +126,9 @@ class Launcher:
         # Register signal handler for graceful shutdown
         signal.signal(signal.SIGINT, signal_handler)
 
-        # Create and start a thread for each module
+        # Create and start a thread for each module, they all start at once and wait for their own dependencies
+        self.ready_events = {module: threading.Event() for module in self.modules_list}
+        threading.Thread(target=self.report_cold_start, name="ColdStart", daemon=True).start()
         for module in self.modules_list:
             self.logger.info(f"Creating thread for module {module}")
             thread = threading.Thread(target=launch_thread, args=(module,))
@@ -112,6 +140,144 @@ class Launcher:
         for thread in self.threads:
             thread.join()
 
+    def orchestrate_processes(self):
+        """
+        Runs every module in its own process, so they do not share a GIL and a crash only takes down that module.
+        The supervisor restarts a module that exits, waiting launch_restart_min_delay seconds at first and doubling
+        the wait after every quick crash up to launch_restart_max_delay.
+        On SIGINT or SIGTERM the modules are stopped in the reverse order they were started (the ui first)
+        """
+        def signal_handler(sig, frame):
+            self.logger.info(f"{signal.Signals(sig).name} received. Stopping all modules...")
+            self.stop_event.set()
+        
+        signal.signal(signal.SIGINT, signal_handler)
+        signal.signal(signal.SIGTERM, signal_handler)
+        
+        # the processes are started by the supervisor once their dependencies are ready
+        self.ready_events = {module: multiprocessing.Event() for module in self.modules_list}
+        threading.Thread(target=self.report_cold_start, name="ColdStart", daemon=True).start()
+        for module in self.modules_list:
+            self.processes[module] = {"process": None, "started": 0, "delay": self.restart_min_delay, "restart_at": 0, "waiting": True}
+            threading.Thread(target=self.start_when_ready, args=(module,), name=f"Start {module}", daemon=True).start()
+        
+        while not self.stop_event.wait(0.5):
+            self.supervise_processes()
+        
+        self.stop_processes()
+        self.logger.info("All modules stopped. Exiting.")
+    
+    def start_process(self, module_name):
+        """
+        Starts the process of a module
+        """
+        entry = self.processes[module_name]
+        entry["process"] = multiprocessing.Process(target=run_module, args=(module_name, self.ready_events[module_name]), name=module_name)
+        entry["process"].start()
+        entry["started"] = time.time()
+        self.logger.info(f"Started process {entry['process'].pid} for module {module_name}")
+    
+    def supervise_processes(self):
+        """
+        Restarts the modules whose process has exited, with a growing delay for the ones that keep crashing
+        """
+        now = time.time()
+        for module_name, entry in self.processes.items():
+            process = entry["process"]
+            if entry["waiting"] or process is not None and process.is_alive():
+                continue
+            
+            if process is not None:
+                # it just exited, work out when to start it again
+                uptime = now - entry["started"]
+                if uptime > self.restart_max_delay:
+                    entry["delay"] = self.restart_min_delay   # it was running fine for a while, not a crash loop
+                self.logger.error(f"Module {module_name} exited with code {process.exitcode} after {uptime:.1f}s, restarting in {entry['delay']}s")
+                entry["restart_at"] = now + entry["delay"]
+                entry["delay"] = min(entry["delay"] * 2, self.restart_max_delay)
+                entry["process"] = None
+            
+            if now >= entry["restart_at"]:
+                self.start_process(module_name)
+    
+    def start_when_ready(self, module_name):
+        """
+        Waits for the dependencies of a module and then starts its process, from then on the supervisor looks after it
+        """
+        self.wait_for_dependencies(module_name)
+        if not self.stop_event.is_set():
+            self.start_process(module_name)
+        self.processes[module_name]["waiting"] = False
+    
+    def get_dependencies(self, module_name):
+        """
+        Returns the modules that have to be ready before this one starts, the ones that are not launched are left out
+        """
+        dependencies = self.config.get(f"{module_name}_depends_on") or []
+        if isinstance(dependencies, str):
+            dependencies = [dependencies]
+        return [dependency for dependency in dependencies if dependency in self.modules_list and dependency != module_name]
+    
+    def wait_for_dependencies(self, module_name):
+        """
+        Blocks until every dependency of the module is ready, a dependency that is not ready after launch_ready_timeout
+        seconds is logged and the module is started anyway
+        """
+        for dependency in self.get_dependencies(module_name):
+            remaining = max(self.ready_timeout - (time.perf_counter() - self.launch_start), 0)
+            self.logger.debug(f"Module {module_name} waiting for {dependency}")
+            if not self.ready_events[dependency].wait(remaining):
+                self.logger.warning(f"Module {dependency} is not ready after {self.ready_timeout}s, starting {module_name} anyway")
+    
+    def report_cold_start(self):
+        """
+        Logs how long each module took to be ready and how long until all of them were, on every launch
+        """
+        pending = list(self.modules_list)
+        while pending and time.perf_counter() - self.launch_start < self.ready_timeout:
+            for module_name in list(pending):
+                if self.ready_events[module_name].is_set():
+                    pending.remove(module_name)
+                    self.logger.info(f"Module {module_name} ready after {time.perf_counter() - self.launch_start:.2f}s")
+            time.sleep(0.01)
+        
+        if pending:
+            self.logger.warning(f"Cold start: {', '.join(pending)} not ready after {self.ready_timeout}s")
+        else:
+            self.logger.info(f"Cold start: all {len(self.modules_list)} modules ready after {time.perf_counter() - self.launch_start:.2f}s")
+    
+    def stop_processes(self):
+        """
+        Stops the modules one at a time in the reverse order they were started
+        every module gets launch_stop_timeout seconds to exit after SIGTERM before it is killed
+        """
+        for module_name in reversed(list(self.processes)):
+            process = self.processes[module_name]["process"]
+            if process is None or not process.is_alive():
+                continue
+            
+            self.logger.info(f"Stopping module {module_name}")
+            process.terminate()
+            process.join(self.stop_timeout)
+            if process.is_alive():
+                self.logger.warning(f"Module {module_name} did not stop, killing it")
+                process.kill()
+                process.join()
+
+
+def run_module(module_name, ready_event):
+    """
+    Entry point of the process of a single module in process mode
+    Ctrl+C reaches every process of the terminal, the children ignore it and wait for the launcher to stop them in order
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # SIGTERM exits through SystemExit, so the finally blocks of the module still run
+    signal.signal(signal.SIGTERM, lambda sig, frame: sys.exit(0))
+    
+    launcher = Launcher()
+    launcher.launch_single_module(module_name, ready_event)
+
+
 if __name__ == "__main__":
     my_launcher = Launcher()
     my_launcher.set_logging_level(logging.DEBUG)
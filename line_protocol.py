@@ -0,0 +1,198 @@
+"""
+The idea of this file is to have a single place that knows how to talk to line based devices
+Both gqrx and rotctld receive one command per line and answer with one or more lines
+This class will split what is received on new lines and match every reply to the command that asked for it,
+so that replies that arrive split over several packets, or merged into one, are still read correctly
+"""
+
+import logging
+import socket
+import threading
+import time
+from collections import deque
+
+
+class LineProtocol:
+    """
+    Wraps an already connected socket.
+    Commands are sent with the number of lines that are expected in the reply,
+    the replies are then read back in the same order the commands were sent.
+
+    Both gqrx and rotctld answer a failed command with a single "RPRT <error>" line,
+    so such a line always ends the reply, no matter how many lines were expected.
+    A command sent with None reply lines (its reply has an unknown length) is read up to its RPRT line.
+    """
+
+    def __init__(self, sock, stats=None, buffer_size=4096, late_reply=None):
+        """
+        stats is an optional CommandStats (see device_driver) where every command is timed
+        late_reply is an optional function called with the command and the lines of every reply that arrived
+        after its exchange gave up on it, so the value is not lost
+        """
+        self.socket = sock
+        self.stats = stats
+        self.late_reply = late_reply
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.recv_buffer = bytearray(buffer_size)      # reused for every recv, avoids allocating a new bytes object per read
+        self.recv_view = memoryview(self.recv_buffer)
+        self.line_buffer = bytearray()                 # bytes received that are not yet a complete line
+
+        self.pending_replies = deque()     # (command, reply_lines) that were sent but whose reply was not read yet
+        self.partial_reply = []            # lines already read for the oldest pending command
+
+        self.command_timeout = None        # timeout of the socket, restored after every exchange
+        self.deadline = None               # time.perf_counter() value at which the current exchange gives up
+
+        # the socket is shared between the rpc server and the samplers, a whole exchange has to happen under this lock
+        self.lock = threading.Lock()
+
+    def send(self, commands):
+        """
+        Receives a list of (command, reply_lines) and writes all of them to the socket in a single batch
+        The commands are remembered so that their replies can be matched later
+        """
+        batch = "".join(f"{command}\n" for command, _ in commands)
+        self.socket.sendall(batch.encode())
+        self.pending_replies.extend(commands)
+
+    def readLine(self):
+        """
+        Returns the next complete line received from the socket, without the new line
+        """
+        while True:
+            end = self.line_buffer.find(b"\n")
+            if end != -1:
+                line = self.line_buffer[:end].decode()
+                del self.line_buffer[:end + 1]
+                return line
+
+            self.limitRead()
+            received = self.socket.recv_into(self.recv_buffer)
+            if received == 0:
+                raise ConnectionError("Connection closed by the device")
+            self.line_buffer += self.recv_view[:received]
+
+    def readReply(self):
+        """
+        Reads the reply to the oldest command that is still waiting for one
+        returns the command and the list of lines of its reply
+        """
+        command, reply_lines = self.pending_replies[0]
+
+        # lines are kept in partial_reply so that a read interrupted halfway can be resumed later
+        lines = self.partial_reply
+        while reply_lines is None or len(lines) < reply_lines:
+            line = self.readLine()
+            lines.append(line)
+            if line.startswith("RPRT ") and (reply_lines is None or line != "RPRT 0"):
+                break   # error reply, the device will not send the remaining lines
+
+        self.pending_replies.popleft()
+        self.partial_reply = []
+        return command, lines
+
+    def discardPending(self):
+        """
+        Reads the replies of commands that were sent but never read and hands them to late_reply
+        this happens when a previous request failed halfway or ran out of time, and would otherwise shift every later reply
+        """
+        while self.pending_replies:
+            command, lines = self.readReply()
+            if self.late_reply is None:
+                self.logger.debug(f"Discarding late reply to {command}: {lines}")
+                continue
+            try:
+                self.late_reply(command, lines)
+            except Exception as e:
+                self.logger.debug(f"Could not use late reply to {command}: {lines} ({e})")
+
+    def limitRead(self):
+        """
+        Called before every recv, makes the read give up at the deadline of the current exchange
+        the socket timeout (the per command timeout) still applies when it is shorter
+        """
+        if self.deadline is None:
+            return
+
+        remaining = self.deadline - time.perf_counter()
+        if remaining <= 0:
+            raise socket.timeout("Deadline reached")
+        if self.command_timeout is not None and self.command_timeout < remaining:
+            remaining = self.command_timeout
+        self.socket.settimeout(remaining)
+
+    def pipeline(self, commands, deadline=None):
+        """
+        Sends all the (command, reply_lines) in one batch and then reads all the replies
+        returns a list with the lines of each reply, in the same order as the commands
+
+        deadline is an optional time.perf_counter() value, replies that did not arrive by then are returned as None.
+        They are read and thrown away at the start of the next exchange, so a slow device can not hold the caller past it
+        """
+        if deadline is None:
+            self.lock.acquire()
+        elif not self.lock.acquire(timeout=max(deadline - time.perf_counter(), 0)):
+            # someone else is still talking to the device
+            return [None] * len(commands)
+
+        # the timeout of the socket is the per command timeout, the deadline only ever shortens it
+        self.command_timeout = self.socket.gettimeout()
+        self.deadline = deadline
+        replies = [None] * len(commands)
+        try:
+            self.discardPending()
+            start = time.perf_counter()
+            self.send(commands)
+
+            for i, (command, _) in enumerate(commands):
+                replies[i] = self.readReply()[1]
+                if self.stats is not None:
+                    # pipelined replies are timed from the moment the batch was sent
+                    self.stats.record(command, time.perf_counter() - start, len(command) + 1, sum(len(line) + 1 for line in replies[i]))
+
+        except socket.timeout:
+            if deadline is None or time.perf_counter() < deadline:
+                self.recordErrors(commands, replies, timeout=True)
+                raise
+            # out of time, but the connection is fine, what is left is discarded by the next exchange
+            if self.stats is not None:
+                for (command, _), lines in zip(commands, replies):
+                    if lines is None:
+                        self.stats.recordLate(command)
+
+        except Exception:
+            self.recordErrors(commands, replies)
+            raise
+
+        finally:
+            self.deadline = None
+            self.socket.settimeout(self.command_timeout)
+            self.lock.release()
+
+        return replies
+
+    def recordErrors(self, commands, replies, timeout=False):
+        """
+        Counts an error for the first command of the exchange that did not get its reply
+        """
+        if self.stats is None:
+            return
+        for (command, _), lines in zip(commands, replies):
+            if lines is None:
+                self.stats.recordError(command, timeout)
+                return
+
+    def request(self, command, reply_lines=1):
+        """
+        Sends a single command and returns the lines of its reply
+        """
+        return self.pipeline([(command, reply_lines)])[0]
+
+    def reset(self):
+        """
+        Forgets everything that was buffered, to be used when the socket is reconnected
+        """
+        self.line_buffer.clear()
+        self.pending_replies.clear()
+        self.partial_reply = []
@@ -4,12 +4,19 @@ It will be resposible for mangaging the interactions between the different parts
 It will implement a xml server that will receive the commands from the other parts
 """
 
-from xmlrpc.server import SimpleXMLRPCServer
-import xmlrpc.client
-from data import Event, MetaData
+import glob
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from data import Event, MetaData, SIGNAL_INTERVALS
+from track import TrackRecorder
+from burst_detector import BurstDetector
 from datetime import datetime
 
 from config_parser import ConfigParser
+from rpc_client import create_rpc_proxy
+from rpc_server import create_rpc_server
 
 class Manager:
     
@@ -23,12 +30,27 @@ class Manager:
         self.config.loadConfig()
         
         # Define the server with IP and port
-        self.server = SimpleXMLRPCServer((self.config.get("manager_rpc_host"), self.config.get("manager_rpc_port")))
+        self.server = create_rpc_server(self.config.get("manager_rpc_host"), self.config.get("manager_rpc_port"), self.config.get("rpc_server_mode"), self.config.get("rpc_pool_size"), self.config.get("rpc_transport"), self.config.get("rpc_unix_folder"), self.config.get("rpc_keepalive_timeout"))
         self.registerFunctions()
         
-        self.gqrx_proxy  = xmlrpc.client.ServerProxy(f"http://{self.config.get('gqrx_rpc_host')}:{self.config.get('gqrx_rpc_port')}")
-        self.rotctl_proxy = xmlrpc.client.ServerProxy(f"http://{self.config.get('rotctl_rpc_host')}:{self.config.get('rotctl_rpc_port')}")
+        # the proxies keep their connections open between calls and can be shared by the threads of the server,
+        # so the connection to gqrx and rotctl is opened once and not for every event
+        self.gqrx_proxy = self.createProxy("gqrx")
+        self.rotctl_proxy = self.createProxy("rotctl")
         
+        # gqrx and rotctl are queried at the same time for every event, so the event waits for the slowest and not for both
+        # gqrx is asked from the thread of the event and rotctl from this pool, the pool only starts a thread when none
+        # is idle, so it is sized for the events that can arrive together (the ui, the burst detector, retries)
+        self.query_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="DeviceQuery")
+        
+        # protects meta_data, start, stop and register can now run at the same time
+        self.meta_lock = threading.Lock()
+        
+        self.track_recorder = None    # records the azimuth, elevation and signal strength of the passage while recording
+        self.burst_detector = None    # registers the signals it finds in the signal strength while recording, if enabled
+        
+        # passages that were being recorded when the manager died are still in the journal folder
+        self.recoverPassages()
         
         self.meta_data = None     # this will be a object of the MetaData class
         # responsible for keeping track of all the data during a passage
@@ -36,6 +58,13 @@ class Manager:
         # and it wil be dumped into a file once we stop recording
 
         
+    def createProxy(self, prefix):
+        """
+        rpc proxy to the server of gqrx or rotctl, every call fails after rpc_call_timeout seconds
+        """
+        return create_rpc_proxy(self.config.get(f"{prefix}_rpc_host"), self.config.get(f"{prefix}_rpc_port"), self.config.get("rpc_transport"),
+                                self.config.get("rpc_unix_folder"), self.config.get("rpc_call_timeout"))
+        
     def registerFunctions(self):
         """
         Register the functions available to the server
@@ -44,6 +73,32 @@ class Manager:
         self.server.register_function(self.startRecording)  # this will be called by the ui class
         self.server.register_function(self.stopRecording)   # this will be called by the ui class
     
+    def recoverPassages(self):
+        """
+        Looks for journals of passages that were never stopped (the manager died during the recording)
+        Each one is replayed into a MetaData object and dumped with the _stopped suffix
+        a journal that can not be recovered is renamed to .failed, so it is kept but not tried again on every start
+        """
+        journal_folder = self.config.get("journal_folder")
+        if not journal_folder or not os.path.isdir(journal_folder):
+            return
+        
+        for journal_path in sorted(glob.glob(os.path.join(journal_folder, "*.jsonl"))):
+            print("Recovering unfinished passage: ", journal_path)
+            try:
+                meta_data = MetaData.from_journal(journal_path, self.config.get("journal_fsync_every"))
+            except Exception as e:
+                print("Error recovering passage: ", e)
+                os.replace(journal_path, journal_path + ".failed")
+                continue
+            
+            # the real end is unknown, the last thing that was written is the best guess
+            if meta_data.end_record_time is None:
+                meta_data.stop_recording(meta_data.event_list[-1].time if meta_data.event_list else meta_data.start_record_time)
+            
+            if meta_data.dump(filename_suffix="stopped"):
+                print(f"  Recovered {len(meta_data.event_list)} events")
+    
     def startRecording(self):
         """
         called by the ui to start recording
@@ -52,59 +107,144 @@ class Manager:
         
         current_time = datetime.now()  # this is the only time that i trust, the manager time
         
-        # create a new metadata object
-        self.meta_data = MetaData()
+        # the detector of a passage that was never stopped may be waiting on meta_lock to register an event
+        self.stopBurstDetector()
+        
+        with self.meta_lock:
+            if self.meta_data is not None:
+                # its journal would stay open with its sync thread running, closed it is recovered on the next start
+                print("The previous passage was never stopped, keeping its journal for recovery")
+                self.meta_data.close()
+            
+            # create a new metadata object
+            self.meta_data = MetaData(self.config.get("journal_folder"), self.config.get("journal_fsync_every"))
+            
+            # start the recording
+            self.meta_data.start_recording(current_time)
+            
+            self.startTrackRecorder()
+            replaced_detector = self.startBurstDetector()
         
-        # start the recording
-        self.meta_data.start_recording(current_time)
+        # only there when another start created a detector between the stop above and the lock
+        if replaced_detector is not None:
+            replaced_detector.stop()
         
         # should call gqrx start recording funciton, but it is still not implemented
         self.gqrx_proxy.start_iq_recording()
                 
         return True
     
+    def startTrackRecorder(self):
+        """
+        Starts recording the continuous track of the passage into the metadata
+        """
+        self.stopTrackRecorder()    # in case the previous passage was never stopped
+        
+        self.track_recorder = TrackRecorder(
+            self.meta_data.track,
+            self.gqrx_proxy.get_radio_info_at,
+            self.rotctl_proxy.get_rotctl_info_at,
+            self.config.get("track_rate"),
+        )
+        self.track_recorder.start()
+    
+    def stopTrackRecorder(self):
+        """
+        Stops recording the track, has to happen before the metadata is dumped
+        """
+        if self.track_recorder is not None:
+            self.track_recorder.stop()
+            self.track_recorder = None
+    
+    def startBurstDetector(self):
+        """
+        Starts the burst detector when it is enabled in the config
+        it reads the dbfs that gqrx already samples in the background, so it does not send anything to gqrx
+        called holding meta_lock, so it does not stop the detector it replaces, that one is returned and
+        the caller stops it once meta_lock is released (see stopBurstDetector)
+        """
+        replaced_detector, self.burst_detector = self.burst_detector, None
+        
+        if not self.config.get("burst_detector"):
+            return replaced_detector
+        
+        self.burst_detector = BurstDetector(
+            lambda since: self.gqrx_proxy.get_field_history("dbfs", since),
+            lambda name, timestamp, extra_data: self.registerEvent(name, timestamp, extra_data),
+            SIGNAL_INTERVALS,
+            self.config.get("burst_threshold_db"),
+            self.config.get("burst_min_duration"),
+            self.config.get("burst_timing_tolerance"),
+            self.config.get("burst_min_confidence"),
+            self.config.get("burst_poll_interval"),
+            self.config.get("burst_floor_window"),
+        )
+        self.burst_detector.start()
+        return replaced_detector
+    
+    def stopBurstDetector(self):
+        """
+        Stops the burst detector, has to happen without holding meta_lock since the detector may be registering an event
+        """
+        if self.burst_detector is not None:
+            self.burst_detector.stop()
+            self.burst_detector = None
+    
     def stopRecording(self):
         """
         called by the ui to stop recording
         Stop the recording of the passage
         """
         
+        self.stopBurstDetector()
+        
         self.gqrx_proxy.stop_iq_recording()
         current_time = datetime.now()  # this is the only time that i trust, the manager time
         
-        # stop the recording
-        self.meta_data.stop_recording(current_time)
-        
-        # should call gqrx stop recording funciton, but it is still not implemented
-        # [check] - implement gqrx stop recording function 
-        
-        # dump the metadata into a file
-        print("Dumping metadata")
-        self.meta_data.dump()
-        self.meta_data = None
+        with self.meta_lock:
+            if self.meta_data is None:
+                print("There is no metadata object. Please start recording first.")
+                return False
+            
+            self.stopTrackRecorder()
+            
+            # stop the recording
+            self.meta_data.stop_recording(current_time)
+            
+            # dump the metadata into a file
+            print("Dumping metadata")
+            self.meta_data.dump()
+            self.meta_data = None
         return True
     
-    def registerEvent(self, event):
+    def registerEvent(self, event, timestamp=None, extra_data=None):
         """
         called by the ui to register an event
         Register an event in the metadata
+        
+        the burst detector also gives the unix timestamp of the start of the signal, and extra data with its confidence
         """
         
         current_time = datetime.now()  # this is the only time that i trust, the manager time
+        if timestamp is not None:
+            # comes from the gqrx samples, gqrx runs on the same machine so the clocks match
+            current_time = datetime.fromtimestamp(timestamp)
 
         # get difference between current time and start time in mm:ss
 
-        if self.meta_data is None:
+        meta_data = self.meta_data    # the passage this event belongs to, self.meta_data may change while the devices are queried
+        if meta_data is None:
             print("There is no metadata object. Please start recording first.")
             return False
     
         # need to query the gqrx and rotctl to get the required information to create the event
         # query gqrx for radio information. i am looking for a sort of snapshot of the radio
+        # the devices are sampled in the background, so this reads the state at the button press instead of waiting on the hardware
+        # both are asked for the same manager time and at the same time, each one on its own thread
+        rotctl_query = self.query_executor.submit(self.queryDevice, self.rotctl_proxy.get_rotctl_info_at, current_time.timestamp())
         try:
-            print("Getting radio dict")
-            radio_dict = self.gqrx_proxy.get_radio_info()         # this will return a dictionary with all the values that have been taken from the server         
-            print("getting rotctl dict")
-            rotctl_dict = self.rotctl_proxy.get_rotctl_info()     # this will return a dictionary with the azimuth and elevation
+            radio_dict, radio_latency = self.queryDevice(self.gqrx_proxy.get_radio_info_at, current_time.timestamp())  # this will return a dictionary with all the values that have been taken from the server
+            rotctl_dict, rotctl_latency = rotctl_query.result()     # this will return a dictionary with the azimuth and elevation
         except Exception as e:
             print("Error in registerEvent: ", e)
             return False
@@ -112,34 +252,56 @@ class Manager:
         # print("Radio dict: ", radio_dict)
         print("Rotctl dict: ", rotctl_dict)
 
-        # get the main information
-        azimuth = rotctl_dict["azimuth"]
-        elevation = rotctl_dict["elevation"]
-        freq = radio_dict["frequency"]
-        gain = radio_dict["gain"]
-
-        # remove the values from the dictionaries so we are only left with the extra data
-        del radio_dict["frequency"]
-        del radio_dict["gain"]
-        del rotctl_dict["azimuth"]
-        del rotctl_dict["elevation"]
+        # get the main information and remove it from the dictionaries so we are only left with the extra data
+        # gqrx leaves out the fields it never managed to read (they are listed in stale_fields), those are saved as null
+        # rotctl does the same when rotctld is down or reconnecting, the event keeps the last known angles or null
+        azimuth = rotctl_dict.pop("azimuth", None)
+        elevation = rotctl_dict.pop("elevation", None)
+        freq = radio_dict.pop("frequency", None)
+        gain = radio_dict.pop("gain", None)
+        
+        # both list their stale fields under the same key, one would overwrite the other
+        stale_fields = [fields for fields in (radio_dict.pop("stale_fields", ""), rotctl_dict.pop("stale_fields", "")) if fields]
+        if stale_fields:
+            radio_dict["stale_fields"] = ",".join(stale_fields)
         
-        elapsed_time = current_time - self.meta_data.start_record_time
+        elapsed_time = current_time - meta_data.start_record_time
         # transform time to string "mm:ss"
         total_seconds = int(elapsed_time.total_seconds())
         minutes = total_seconds // 60
         seconds = total_seconds % 60
         elapsed_time_str = f"{minutes:02}:{seconds:02}"
         
-        my_event = Event(event, current_time, elapsed_time_str, freq, gain, azimuth, elevation, {**rotctl_dict, **radio_dict})
+        # query_latency is the rpc round trip, sample_age is how far the reading is from the event time (the sample
+        # may be up to telemetry_max_age old, or interpolated between two), both in seconds
+        latencies = {"gqrx_query_latency": round(radio_latency, 4), "rotctl_query_latency": round(rotctl_latency, 4)}
+        for name, device_dict in (("gqrx", radio_dict), ("rotctl", rotctl_dict)):
+            if "sample_age" in device_dict:
+                latencies[f"{name}_sample_age"] = round(device_dict.pop("sample_age"), 4)
+        
+        # the values were built by gqrx and rotctl, no need to pay for validating them again
+        my_event = Event.trusted(event, current_time, elapsed_time_str, freq, gain, azimuth, elevation, {**rotctl_dict, **radio_dict, **latencies, **(extra_data or {})})
 
         # register the event
-        self.meta_data.register_event(my_event)
+        with self.meta_lock:
+            if self.meta_data is not meta_data:
+                print("Recording was stopped before the event could be registered.")
+                return False
+            meta_data.register_event(my_event)
 
         print("Event received: ", event)
         print("  at time: ", current_time)
         return True
     
+    def queryDevice(self, function, timestamp):
+        """
+        Calls function (a proxy method) with the timestamp
+        returns the reply and how long the call took, in seconds
+        """
+        started = time.perf_counter()
+        reply = function(timestamp)
+        return reply, time.perf_counter() - started
+    
     def main(self):
         """
         This is the class that will be used for the code to run itself
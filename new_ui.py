@@ -3,11 +3,12 @@ from datetime import datetime, timedelta
 import random
 import atexit
 import signal
-import xmlrpc.client
 
 
-from data import MetaData, Event
+from data import MetaData, Event, SIGNAL_INTERVALS
 from config_parser import ConfigParser
+from rpc_client import create_rpc_proxy
+from rpc_worker import RpcWorker
 
 
 class Ui:
@@ -17,18 +18,16 @@ class Ui:
         self.config = ConfigParser()
         self.config.loadConfig()
         
-        # rpc proxy to send the events
-        self.proxy = xmlrpc.client.ServerProxy(f"http://{self.config.get('manager_rpc_host')}:{self.config.get('manager_rpc_port')}/")
+        # rpc calls to the manager are sent by a worker thread, so a slow manager does not freeze the ui
+        manager_address = (self.config.get("manager_rpc_host"), self.config.get("manager_rpc_port"), self.config.get("rpc_transport"),
+                           self.config.get("rpc_unix_folder"), self.config.get("rpc_call_timeout"))
+        self.rpc = RpcWorker(lambda: create_rpc_proxy(*manager_address))
 
 
         # these are all configs that should be loaded from a config file
         # Signal intervals in seconds
         self.SIGNALS = ["AFSK", "Beacon", "Long Beacon"]    # this should be just a single dictionary and not two separate variables
-        self.INTERVALS = {
-            "AFSK": 120,         # 2 minutes
-            "Beacon": 60,        # 1 minute
-            "Long Beacon": 300   # 5 minutes
-        }
+        self.INTERVALS = SIGNAL_INTERVALS
 
         # Event colors for actual and expected events and buttons
         self.EVENT_COLORS = {
@@ -73,6 +72,10 @@ class Ui:
         self.recording_duration_label = tk.Label(self.app, text="Recording Duration: 00:00", font=("Helvetica", 12), pady=5)
         self.recording_duration_label.pack()
         
+        # shows calls to the manager that are still pending or that failed
+        self.rpc_status_label = tk.Label(self.app, text="Manager: idle", font=("Helvetica", 10), pady=2)
+        self.rpc_status_label.pack()
+        
         # Main frame to organize left and right sections
         self.main_frame = tk.Frame(self.app)
         self.main_frame.pack(fill="both", expand=True)
@@ -146,6 +149,29 @@ class Ui:
         self.app.after(1000, self.updateCurrentTimeBar)
         
     
+    def processRpcResults(self):
+        """
+        Runs the callbacks of the calls sent to the manager, it is polled from the tk thread
+        """
+        self.rpc.process_results()
+        
+        # a failure stays on the label until the next call finishes
+        if self.rpc_status_label.cget("fg") != "red":
+            self.rpc_status_label.config(text=f"Manager: {self.rpc.pending} pending" if self.rpc.pending else "Manager: idle")
+        
+        self.app.after(50, self.processRpcResults)
+    
+    def rpcDone(self, method_name, result, error):
+        """
+        Callback for the calls to the manager, shows the calls that failed or were refused
+        """
+        if error is not None:
+            self.rpc_status_label.config(text=f"Manager: {method_name} failed ({error})", fg="red")
+        elif result is False:
+            self.rpc_status_label.config(text=f"Manager: {method_name} was refused", fg="red")
+        else:
+            self.rpc_status_label.config(text=f"Manager: {self.rpc.pending} pending" if self.rpc.pending else "Manager: idle", fg="black")
+    
     def addTimilineEvent(self, event_time, signal_type, event_type):
         if not self.is_recording:
             return
@@ -170,7 +196,7 @@ class Ui:
         self.addTimilineEvent(datetime.now() + timedelta(seconds=self.INTERVALS[signal_type]), signal_type, "expected")
         
         # register event with the manager
-        self.proxy.registerEvent(signal_type)     # [check] - eventually should make these call async
+        self.rpc.call("registerEvent", signal_type, callback=self.rpcDone)
         # signal_info = (
         #     f"Signal Type: {signal_type}\n"
         #     f"Time: {detection_time.strftime('%H:%M:%S')}\n"
@@ -188,7 +214,7 @@ class Ui:
         """
         
         # call remote method to start recording
-        self.proxy.startRecording()    # [check] - eventually should make these call async
+        self.rpc.call("startRecording", callback=self.rpcDone)
         
         self.resetCountdowns()
         self.is_recording = True
@@ -204,7 +230,7 @@ class Ui:
         """
         
         # call remote method to stop recording
-        self.proxy.stopRecording()    # [check] - eventually should make these call async
+        self.rpc.call("stopRecording", callback=self.rpcDone)
         
         self.is_recording = False
         self.status_label.config(text="Recording stopped", bg="green")
@@ -225,6 +251,7 @@ class Ui:
     def loop(self):
         self.updateCountdowns()
         self.updateCurrentTimeBar()
+        self.processRpcResults()
         self.app.mainloop()
 
     def main(self):
@@ -1,17 +1,18 @@
-from xmlrpc.server import SimpleXMLRPCServer
-import socket
+import time
 
-from config_parser import ConfigParser
+from device_driver import DeviceDriver
+from telemetry import TelemetrySampler
 
 """
 The idea of this file is to create a class that will handle the connection and communication with rotctld
 It will allow to easily send commands to the controller and receive back information from the controller
 """
 
-class RotCtl:
+class RotCtl(DeviceDriver):
     """
     Class that will handle the connection and interface with rotctld
-    Receives ip, port, max_azi, min_azi, max_ele, min_ele
+    The ip, port and the rotor limits (max_azi, min_azi, max_ele, min_ele) are loaded from the config file
+    The connection handling (timeouts, reconnecting, health checks) comes from DeviceDriver
     
     Will not send commands out of bounds
     
@@ -22,53 +23,40 @@ class RotCtl:
     
     def __init__(self):
         """
-        Receives host list and port list, the order is [rotctl, rpc_server]
+        Everything is loaded from the config file, the keys start with rotctl_
         """
-
-        # load the config file
-        self.config = ConfigParser()
-        self.config.loadConfig()
-
-        self.rotctl_ip = self.config.get("rotctl_ip")
-        self.rotctl_port = self.config.get("rotctl_port")
+        super().__init__("rotctl")
         
-        self.socket = None
-        self.isConnected = True
-    
-        self.server = SimpleXMLRPCServer((self.config.get("rotctl_rpc_host"), self.config.get("rotctl_rpc_port")))
-        self.registerFunctions()
+        # rotor limits, positions outside of these are never sent to rotctld
+        self.min_azi = self.config.get("rotctl_min_azimuth")
+        self.max_azi = self.config.get("rotctl_max_azimuth")
+        self.min_ele = self.config.get("rotctl_min_elevation")
+        self.max_ele = self.config.get("rotctl_max_elevation")
+        
+        # samples the rotor in the background so that events do not have to wait on rotctld
+        self.sampler = TelemetrySampler("RotCtl", self.sample_rotctl_info, self.config.get("rotctl_sample_rate"), self.config.get("telemetry_buffer_size"))
+        self.max_sample_age = self.config.get("telemetry_max_age")
         
     def registerFunctions(self):
         """
         Register the functions available to the server
         """
-        # for now i am only exposing this function
-        # but in the future i should expose other functions as well
+        super().registerFunctions()
         self.server.register_function(self.get_rotctl_info)
+        self.server.register_function(self.get_rotctl_info_at)
 
-    def startConnection(self):
+    def startServices(self):
         """
-        Will start a connection to the rotctld server
+        Starts the connection supervisor and the background sampler
         """
-        try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.rotctl_ip, self.rotctl_port))
-            return True
-        except Exception as e:
-            print("Error in startConnection: ", e)
-            return False
+        super().startServices()
+        self.sampler.start()
     
-    def stopConnection(self):
+    def healthCheck(self):
         """
-        Will stop the connection to the rotctld server
+        Reading the position is harmless, a failure marks the connection as lost
         """
-        try:
-            self.socket.close()
-            return True
-        except Exception as e:
-            print("Error in stopConnection: ", e)
-            return False
-        
+        self.request("p", 2)
         
     def setAzimuthElevation(self, azimuth, elevation):
         """
@@ -77,22 +65,25 @@ class RotCtl:
         try:
             
             if not self.isConnected:
-                print("Not connected to rotctld")
+                self.logger.warning("Not connected to rotctld")
                 return False
         
             if azimuth < self.min_azi or azimuth > self.max_azi:
-                print("Azimuth out of bounds")
+                self.logger.warning(f"Azimuth {azimuth} out of bounds")
                 return False
             
             if elevation < self.min_ele or elevation > self.max_ele:
-                print("Elevation out of bounds")
+                self.logger.warning(f"Elevation {elevation} out of bounds")
                 return False
             
-            command = f"P {azimuth} {elevation}\n"
-            self.socket.sendall(command.encode())
+            # rotctld always answers a set command, the reply has to be read or it would be taken as the answer to the next command
+            reply = self.request(f"P {azimuth} {elevation}")[0]
+            if reply != "RPRT 0":
+                self.logger.warning(f"rotctld refused the position: {reply}")
+                return False
             return True
         except Exception as e:
-            print("Error in setAzimuthElevation: ", e)
+            self.logger.error(f"Error in setAzimuthElevation: {e}")
             return False
         
     
@@ -103,47 +94,75 @@ class RotCtl:
         try:
             
             if not self.isConnected:
-                print("Not connected to rotctld")
                 return None, None
         
-            command = "p\n"
-            self.socket.sendall(command.encode())
-            data = self.socket.recv(1024).decode()
-            data = data.split("\n")[:-1]
+            data = self.request("p", 2)
             azimuth = float(data[0])
             elevation = float(data[1])
             return azimuth, elevation
         except Exception as e:
-            print("Error in getAzimuthElevation: ", e)
+            self.logger.error(f"Error in getAzimuthElevation: {e}")
             return None, None
         
+    def sample_rotctl_info(self):
+        """
+        Used by the background sampler, raises instead of returning None so that failed reads are not stored
+        """
+        azimuth, elevation = self.getAzimuthElevation()
+        if azimuth is None:
+            raise ConnectionError("Could not read azimuth and elevation")
+        
+        return {"azimuth": azimuth, "elevation": elevation}
+    
     def get_rotctl_info(self):
         """
         Function exposed to the outside world to get the rotctl info
+        when rotctld can not be read (down or reconnecting) the last sampled position is returned instead,
+        with both fields listed in "stale_fields" like gqrx does, and without them if it was never sampled.
+        xmlrpc can not send None, so None is never returned
         """
-        print("Getting rotctl info")
+        self.logger.debug("Getting rotctl info")
+        
+        if not self.isConnected:
+            self.logger.warning("Not connected to rotctld")
         
         azimuth, elevation = self.getAzimuthElevation()
+        if azimuth is None or elevation is None:
+            _, last_sample = self.sampler.buffer.latest()
+            output_dict = dict(last_sample or {})
+            output_dict["stale_fields"] = "azimuth,elevation"
+            return output_dict
+        
         output_dict = {"azimuth": azimuth, "elevation": elevation}
 
-        print("  rotctl info: ", output_dict)
+        self.logger.debug(f"  rotctl info: {output_dict}")
         
         return output_dict
     
-    def main(self):
-        """
-        This is the class that will be used for the code to run itself
-        """
-        self.startConnection()
-        self.server.serve_forever()
-
+    def get_rotctl_info_at(self, timestamp):
+        """
+        Returns the rotctl info at the given unix timestamp, taken from the background samples
+        if there is no sample close enough to the timestamp it will query rotctld directly
+        "sample_age" is how many seconds the sample (or the direct query) is away from the timestamp,
+        it is left out when rotctld could not be read and nothing was sampled either
+        Function exposed to the outside world
+        """
+        output_dict, sample_time = self.sampler.at(timestamp, self.max_sample_age)
+        if output_dict is None:
+            self.logger.info("No recent rotctl sample, querying rotctld")
+            output_dict = self.get_rotctl_info()
+            # a stale reply is the last sample, not the position now
+            sample_time = self.sampler.buffer.latest()[0] if "stale_fields" in output_dict else time.time()
+        
+        if sample_time is not None:
+            output_dict["sample_age"] = abs(sample_time - timestamp)
+        return output_dict
+    
 def main():
     
     
     my_rot = RotCtl()
-    my_rot.startConnection()
-    
-    my_rot.server.serve_forever()
+    my_rot.main()
     
     my_rot.stopConnection()
     
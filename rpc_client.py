@@ -0,0 +1,123 @@
+"""
+The idea of this file is to create the proxies used to call the rpc servers of the manager, gqrx and rotctl
+with the transport selected by rpc_transport in config.ini, see rpc_server and fast_rpc
+
+The xmlrpc proxies use PooledTransport, that keeps the http connections open between calls (the xmlrpc servers
+answer with HTTP/1.1 keep-alive in threaded mode), so the tcp handshake is paid once per session
+and not on every call. The pool also makes a single proxy safe to share between threads.
+"""
+
+import http.client
+import threading
+import xmlrpc.client
+
+from fast_rpc import FastRPCProxy, unix_socket_path
+
+
+class PooledTransport(xmlrpc.client.Transport):
+    """
+    xmlrpc transport with a pool of keep-alive connections
+    every call takes an idle connection from the pool (or opens a new one) and puts it back once the reply was read,
+    so calls from several threads use different connections at the same time.
+    When the server closed an idle connection the pool is emptied and the call sent again on a new one, once.
+    Every call fails with socket.timeout after timeout seconds
+    """
+
+    def __init__(self, timeout=None, pool_size=4):
+        super().__init__()
+        self.timeout = timeout
+        self.pool_size = pool_size      # idle connections kept, the ones above it are closed
+        self.idle = {}                  # host : [idle connections]
+        self.lock = threading.Lock()
+
+    def acquire(self, host):
+        """
+        Returns an idle connection to host and True, or a new one and False
+        """
+        with self.lock:
+            idle = self.idle.get(host)
+            if idle:
+                return idle.pop(), True
+
+        chost, _, _ = self.get_host_info(host)
+        return http.client.HTTPConnection(chost, timeout=self.timeout), False
+
+    def release(self, host, connection):
+        """
+        Puts a connection back in the pool
+        """
+        with self.lock:
+            idle = self.idle.setdefault(host, [])
+            if len(idle) < self.pool_size:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def request(self, host, handler, request_body, verbose=False):
+        for attempt in range(2):
+            connection, reused = self.acquire(host)
+            try:
+                response = self.send_call(connection, host, handler, request_body)
+            except (http.client.RemoteDisconnected, ConnectionResetError, ConnectionAbortedError, BrokenPipeError):
+                # the server closed an idle connection, nothing was answered so the call can be sent again
+                # the other idle connections were most likely closed too, the call is sent on a new one
+                connection.close()
+                if not reused or attempt:
+                    raise
+                self.close()
+                continue
+            except Exception:
+                connection.close()
+                raise
+
+            try:
+                if response.status != 200:
+                    response.read()
+                    raise xmlrpc.client.ProtocolError(host + handler, response.status, response.reason, dict(response.getheaders()))
+                self.verbose = verbose
+                result = self.parse_response(response)
+            except Exception:
+                connection.close()
+                raise
+
+            if response.will_close:
+                connection.close()
+            else:
+                self.release(host, connection)
+            return result
+
+    def send_call(self, connection, host, handler, request_body):
+        """
+        Sends the call on the connection and returns the response, the body is not read
+        """
+        _, extra_headers, _ = self.get_host_info(host)
+        connection.putrequest("POST", handler)
+        headers = self._headers + (extra_headers or []) + [("Content-Type", "text/xml"), ("User-Agent", self.user_agent)]
+        self.send_headers(connection, headers)
+        self.send_content(connection, request_body)
+        return connection.getresponse()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+def create_rpc_proxy(host, port, transport="xmlrpc", unix_folder="/tmp", timeout=None):
+    """
+    Creates a proxy to the rpc server at the given address, it has to match the transport of the server
+    every call fails after timeout seconds (None waits forever)
+    an unknown transport falls back to xmlrpc
+    """
+    if transport == "tcp":
+        return FastRPCProxy((host, port), timeout)
+
+    if transport == "unix":
+        return FastRPCProxy(unix_socket_path(unix_folder, port), timeout)
+
+    if transport != "xmlrpc":
+        print(f"Unknown rpc transport {transport}, using xmlrpc")
+
+    return xmlrpc.client.ServerProxy(f"http://{host}:{port}/", transport=PooledTransport(timeout))
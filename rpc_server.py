@@ -0,0 +1,103 @@
+"""
+The idea of this file is to create the xmlrpc servers used by the manager, gqrx and rotctl
+SimpleXMLRPCServer answers one request at a time, so a slow request blocks every other client.
+The mode in config.ini selects how the requests are served:
+    simple   - one request at a time, the stdlib SimpleXMLRPCServer
+    threaded - a new thread for every request
+    pool     - requests are handed to a fixed pool of threads
+rpc_transport selects the protocol, xmlrpc or the length prefixed json of fast_rpc over tcp or a unix socket
+(fast_rpc always uses a thread per connection, the mode only applies to xmlrpc)
+
+In threaded mode the xmlrpc server speaks HTTP/1.1 and keeps the connection open after a call, so the pooled
+clients of rpc_client do not open a new connection per call. A connection idle for keepalive_timeout seconds is closed
+(quietly, the pooled clients leave their idle connections open so it happens all the time).
+In simple and pool mode an idle open connection would hold the only thread or one of the pool threads, and the calls
+of the other clients would wait behind it, so they still close the connection after each call
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn
+from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+
+from fast_rpc import FastRPCServer, UnixFastRPCServer, unix_socket_path
+
+
+def keepalive_handler(keepalive_timeout):
+    """
+    Returns a request handler class that keeps the connection open for keepalive_timeout seconds after each call
+    """
+    class KeepAliveRequestHandler(SimpleXMLRPCRequestHandler):
+        protocol_version = "HTTP/1.1"
+        timeout = keepalive_timeout
+
+        def log_error(self, format, *args):
+            # an idle connection of a pooled client reaching the timeout is the normal way it is closed, not an error
+            if format.startswith("Request timed out"):
+                return
+            super().log_error(format, *args)
+
+    return KeepAliveRequestHandler
+
+
+class ThreadedXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+    """
+    Serves every request on its own thread
+    """
+    daemon_threads = True
+
+
+class PooledXMLRPCServer(SimpleXMLRPCServer):
+    """
+    Serves the requests on a fixed pool of threads, so a burst of clients can not create an unbounded number of threads
+    """
+
+    def __init__(self, address, pool_size=8, **kwargs):
+        super().__init__(address, **kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="XMLRPC")
+
+    def process_request(self, request, client_address):
+        """
+        Hands the request to the pool instead of handling it on the serving thread
+        """
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        """
+        Same as ThreadingMixIn, runs on one of the pool threads
+        """
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+
+def create_rpc_server(host, port, mode="simple", pool_size=8, transport="xmlrpc", unix_folder="/tmp", keepalive_timeout=10.0):
+    """
+    Creates the rpc server for the given address using the requested mode and transport
+    an unknown mode falls back to simple and an unknown transport to xmlrpc
+    """
+    if transport == "tcp":
+        return FastRPCServer((host, port))
+
+    if transport == "unix":
+        return UnixFastRPCServer(unix_socket_path(unix_folder, port))
+
+    if transport != "xmlrpc":
+        print(f"Unknown rpc transport {transport}, using xmlrpc")
+
+    if mode == "threaded":
+        return ThreadedXMLRPCServer((host, port), requestHandler=keepalive_handler(keepalive_timeout))
+
+    if mode == "pool":
+        return PooledXMLRPCServer((host, port), pool_size=pool_size)
+
+    if mode != "simple":
+        print(f"Unknown rpc server mode {mode}, using simple")
+
+    return SimpleXMLRPCServer((host, port))
@@ -0,0 +1,68 @@
+"""
+The idea of this file is to take the rpc calls off the tkinter main thread
+Calls are put in a queue and a worker thread sends them to the server one by one, in order.
+The results are put in a second queue that the ui drains from its own thread (with after()),
+since tkinter widgets can only be touched from the thread running the mainloop
+"""
+
+import queue
+import threading
+
+
+class RpcWorker:
+    """
+    Sends the queued calls using a proxy created by proxy_factory on the worker thread
+    """
+
+    def __init__(self, proxy_factory):
+        """
+        proxy_factory is a function with no arguments that returns a new proxy to the server
+        """
+        self.proxy_factory = proxy_factory
+
+        self.calls = queue.Queue()      # (method_name, args, callback) waiting to be sent
+        self.results = queue.Queue()    # (callback, method_name, result, error) waiting for the ui
+        self.pending = 0                # calls queued or in flight, only touched by the ui thread
+
+        self.thread = threading.Thread(target=self.run, name="RpcWorker", daemon=True)
+        self.thread.start()
+
+    def call(self, method_name, *args, callback=None):
+        """
+        Queues a call and returns right away
+        callback(method_name, result, error) is called from process_results once the call is done
+        error is None when the call succeeded
+        """
+        self.pending += 1
+        self.calls.put((method_name, args, callback))
+
+    def run(self):
+        """
+        Worker loop, the proxy is created here so that it is only used by this thread
+        """
+        proxy = self.proxy_factory()
+
+        while True:
+            method_name, args, callback = self.calls.get()
+            try:
+                result = getattr(proxy, method_name)(*args)
+                self.results.put((callback, method_name, result, None))
+            except Exception as e:
+                print(f"Error calling {method_name}: ", e)
+                # the connection may be broken, start the next call with a fresh proxy
+                proxy = self.proxy_factory()
+                self.results.put((callback, method_name, None, e))
+
+    def process_results(self):
+        """
+        Runs the callbacks of the finished calls, has to be called from the ui thread
+        """
+        while True:
+            try:
+                callback, method_name, result, error = self.results.get_nowait()
+            except queue.Empty:
+                return
+
+            self.pending -= 1
+            if callback is not None:
+                callback(method_name, result, error)
@@ -0,0 +1,210 @@
+"""
+The idea of this file is to keep a recent history of the state of a device (rotor or radio)
+A sampler thread asks the device for its state at a fixed rate and stores it in a ring buffer
+so that when an event happens the state at that moment can be read without waiting on the hardware
+"""
+
+import bisect
+import logging
+import threading
+import time
+
+
+class TelemetryBuffer:
+    """
+    Fixed size ring buffer of (timestamp, sample) pairs.
+    Timestamps are unix timestamps in seconds (time.time()), samples are dictionaries.
+    Once it is full the oldest sample is overwritten.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.times = [0.0] * size
+        self.samples = [None] * size
+        self.count = 0      # total number of samples ever appended, the next one goes to count % size
+        self.lock = threading.Lock()
+
+    def append(self, timestamp, sample):
+        """
+        Stores a new sample, timestamps are expected to only go forward
+        """
+        with self.lock:
+            index = self.count % self.size
+            self.times[index] = timestamp
+            self.samples[index] = sample
+            self.count += 1
+
+    def latest(self):
+        """
+        Returns the newest (timestamp, sample) or (None, None) if nothing was stored yet
+        """
+        with self.lock:
+            if self.count == 0:
+                return None, None
+            index = (self.count - 1) % self.size
+            return self.times[index], self.samples[index]
+
+    def locate(self, timestamp, bisect_function):
+        """
+        Position of the timestamp in the samples ordered from the oldest to the newest, found with bisect_function
+        (bisect.bisect_left or bisect_right) straight on the ring, without copying it. Has to be called holding self.lock
+        Once the ring wrapped it holds two sorted runs, the older one from the write position to the end
+        and the newer one from the start to the write position
+        """
+        if self.count <= self.size:
+            return bisect_function(self.times, timestamp, 0, self.count)
+
+        start = self.count % self.size
+        position = bisect_function(self.times, timestamp, start, self.size)
+        if position < self.size:
+            return position - start
+        return self.size - start + bisect_function(self.times, timestamp, 0, start)
+
+    def entry(self, position):
+        """
+        (timestamp, sample) at the given position from the oldest, has to be called holding self.lock
+        """
+        index = (self.count + position) % self.size if self.count > self.size else position
+        return self.times[index], self.samples[index]
+
+    def since(self, timestamp):
+        """
+        Returns the timestamps and samples stored after the given timestamp, from the oldest to the newest
+        """
+        with self.lock:
+            length = min(self.count, self.size)
+            entries = [self.entry(position) for position in range(self.locate(timestamp, bisect.bisect_right), length)]
+        return [entry[0] for entry in entries], [entry[1] for entry in entries]
+
+    def at(self, timestamp, max_age=None):
+        """
+        Returns the state of the device at the given timestamp
+        If the timestamp falls between two samples the numeric fields are linearly interpolated,
+        everything else is taken from the nearest sample.
+        Returns the state and the timestamp of the sample closest to the timestamp (the one the state was taken
+        or interpolated from), or None, None when there is no sample closer than max_age seconds to the timestamp
+        the ring is searched in place, only the two samples around the timestamp are read
+        """
+        with self.lock:
+            length = min(self.count, self.size)
+            if length == 0:
+                return None, None
+
+            position = self.locate(timestamp, bisect.bisect_left)
+
+            # outside of the stored window, the best we have is the closest sample
+            if position == 0 or position == length:
+                nearest_time, nearest = self.entry(0 if position == 0 else length - 1)
+                if max_age is not None and abs(nearest_time - timestamp) > max_age:
+                    return None, None
+                return dict(nearest), nearest_time
+
+            before_time, before = self.entry(position - 1)
+            after_time, after = self.entry(position)
+
+        if max_age is not None and min(timestamp - before_time, after_time - timestamp) > max_age:
+            return None, None
+
+        weight = (timestamp - before_time) / (after_time - before_time) if after_time != before_time else 0.0
+        nearest, nearest_time = (before, before_time) if weight < 0.5 else (after, after_time)
+
+        result = {}
+        for key, value in nearest.items():
+            before_value, after_value = before.get(key), after.get(key)
+            if isNumber(before_value) and isNumber(after_value):
+                result[key] = before_value + (after_value - before_value) * weight
+            else:
+                result[key] = value
+
+        return result, nearest_time
+
+
+def isNumber(value):
+    """
+    True for ints and floats, bools are left out because they can not be interpolated
+    """
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class TelemetrySampler:
+    """
+    Calls sample_function at a fixed rate on a background thread and stores the result in a TelemetryBuffer
+    sample_function should return a dictionary, or raise when the device could not be read
+    """
+
+    def __init__(self, name, sample_function, rate, buffer_size):
+        """
+        rate is in samples per second, a rate of 0 means that the sampler will not run
+        """
+        self.name = name
+        self.logger = logging.getLogger(f"{name}Sampler")
+        self.sample_function = sample_function
+        self.rate = rate
+        self.buffer = TelemetryBuffer(buffer_size)
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Starts the sampling thread
+        """
+        if not self.rate:
+            self.logger.info("Sampler is disabled")
+            return False
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name=f"{self.name}Sampler", daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        """
+        Asks the sampling thread to stop and waits for it
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+
+    def run(self):
+        """
+        Sampling loop, keeps a fixed period no matter how long each sample takes
+        """
+        period = 1.0 / self.rate
+        next_sample = time.time()
+        failing = False
+
+        while not self.stop_event.is_set():
+            before = time.time()
+            try:
+                sample = self.sample_function()
+                # the device answered somewhere between the request and the reply, the middle is the best guess
+                self.buffer.append((before + time.time()) / 2, sample)
+                if failing:
+                    self.logger.info("Sampler recovered")
+                failing = False
+            except Exception as e:
+                # only report when it starts failing, otherwise it would log at the sampling rate
+                if not failing:
+                    self.logger.warning(f"Sampling failed: {e}")
+                failing = True
+
+            next_sample += period
+            delay = next_sample - time.time()
+            if delay < 0:
+                # fell behind (slow device), start counting again from now instead of bursting
+                next_sample = time.time()
+                delay = 0
+            self.stop_event.wait(delay)
+
+    def since(self, timestamp):
+        """
+        Returns the samples stored after the given timestamp, see TelemetryBuffer.since
+        """
+        return self.buffer.since(timestamp)
+
+    def at(self, timestamp, max_age=None):
+        """
+        Returns the sampled state at the given timestamp, see TelemetryBuffer.at
+        """
+        return self.buffer.at(timestamp, max_age)
@@ -8,50 +8,40 @@ this script will go over all the jsons, check if they have the elapsed time
 elapsed time is in format mm:ss
 
 assuming that we are running this file from the repo root folder
+    python tools/add_elapsed_time.py [--dry-run] [--workers N]
 """
 
-import json
 import datetime
 
-from common import get_json_list, check_elapsed_time, load_data, dump_data
+from common import check_elapsed_time, run_migrations, parse_migration_arguments
 
-if __name__ == "__main__":
-    
-    _, json_folder_list = get_json_list()
 
+def add_elapsed_time(data):
+    """
+    Migration that adds the elapsed time to every event of a passage
+    returns True if the passage was changed
+    """
+    if check_elapsed_time(data):
+        return False
 
-    for json_file_path in json_folder_list:
-        print(json_file_path)
-        
-        data = load_data(json_file_path)
+    # means that elapsed time is not present, lets calculate it and add to each event
+    start_time = datetime.datetime.fromisoformat(data["start_record_time"])
+    for evn in data["event_list"]:
+        event_time = datetime.datetime.fromisoformat(evn["time"])
         
-        if check_elapsed_time(data):
-            print("  Elapsed time present, skipping")
-            continue
-
-
-        # means that elapsed time is not present, lets calculate it and add to each event
-        # start_time = datetime.datetime.strptime(data["start_record_time"], "%Y_%m_%d_%H-%M-%S")
-        start_time = datetime.datetime.fromisoformat(data["start_record_time"])
-        print("  Start  time: ", start_time)
-        for evn in data["event_list"]:
-            event_time = datetime.datetime.fromisoformat(evn["time"])
-            
-            elapsed_time = event_time - start_time
-
-            total_seconds = int(elapsed_time.total_seconds())
-            minutes = total_seconds // 60
-            seconds = total_seconds % 60
-            elapsed_time_str = f"{minutes:02}:{seconds:02}"
-            
-            print("    Event time: ", event_time)
-            print("     Elapsed time: ", elapsed_time)
-            print("     Elapsed string: ", elapsed_time_str)
-            
-            evn["elapsed_time"] = elapsed_time_str
-            
-        # have finished changing this passage
-        print("  Finished changing this passage, saving dict")
+        elapsed_time = event_time - start_time
+
+        total_seconds = int(elapsed_time.total_seconds())
+        minutes = total_seconds // 60
+        seconds = total_seconds % 60
         
-        dump_data(data, json_file_path)
-            
\ No newline at end of file
+        evn["elapsed_time"] = f"{minutes:02}:{seconds:02}"
+
+    return True
+
+
+if __name__ == "__main__":
+    
+    args = parse_migration_arguments("Adds the elapsed time to the events of old passages")
+    
+    run_migrations([("add_elapsed_time", add_elapsed_time)], args.folder, args.dry_run, args.workers)
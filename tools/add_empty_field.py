@@ -2,11 +2,37 @@
 This script will be used to add extra fields to previous generated jsons
 They will start as empty fields
 This is to make sure that old jsons can be updated
+
+assuming that we are running this file from the repo root folder
+    python tools/add_empty_field.py [--dry-run] [--workers N]
 """
 
+from functools import partial
+
+from common import run_migrations, parse_migration_arguments
+
+
+def add_empty_field(data, field_name, dict_location):
+    """
+    Migration that adds an empty field to the root of the passage (dict_location "")
+    or to every element of the list at dict_location
+    returns True if the passage was changed
+    """
+    if dict_location == "":
+        # means that it is in the root of the dictionary
+        if field_name in data:
+            return False
+        data[field_name] = ""
+        return True
 
-from common import get_json_list, load_data, dump_data
+    # means that it is in the event list, add the field to each event that does not have it yet
+    changed = False
+    for evn in data[dict_location]:
+        if field_name not in evn:
+            evn[field_name] = ""
+            changed = True
 
+    return changed
 
 
 if __name__ == "__main__":
@@ -14,32 +40,8 @@ if __name__ == "__main__":
     field_name = "cutted"
     dict_location = "event_list"
     
-    # get the list of jsons
-    _, json_folder_list = get_json_list()
+    args = parse_migration_arguments(f"Adds the empty field {field_name} to {dict_location or 'the root'} of old passages")
     
-    for json_file_path in json_folder_list:
-        print(json_file_path)
-        
-        data = load_data(json_file_path)
-        
-        # check if the field is already present
-        if field_name in data[dict_location][0]:
-            print("  Field already present, skipping")
-            continue
-        
-        if dict_location == "":
-            # means that it is in the root of the dictionary
-            print(f"  Adding field to root {field_name}")
-            data[field_name] = ""
-        else:
-            # means that it is in the event list
-            
-            # add the field to each event
-            for evn in data[dict_location]:
-                print(f"   Adding field to event {field_name}")
-                evn[field_name] = ""
-        
-        # have finished changing this passage
-        print("  Finished changing this passage, saving dict")
-        
-        dump_data(data, json_file_path)
\ No newline at end of file
+    # the name of the migration includes the field, so adding a different field later is a new migration
+    migration_name = f"add_empty_field:{dict_location}:{field_name}"
+    run_migrations([(migration_name, partial(add_empty_field, field_name=field_name, dict_location=dict_location))], args.folder, args.dry_run, args.workers)
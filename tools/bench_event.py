@@ -0,0 +1,86 @@
+"""
+Small benchmark for the Event class
+It compares the slotted Event (validated and trusted construction) with a plain class
+that has a __dict__ and validates every value, which is how Event used to be built
+
+assuming that we are running this file from the repo root folder
+    python tools/bench_event.py
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from data import Event
+
+
+class PlainEvent:
+    """
+    Same data as Event, with a per instance __dict__ and validation on every construction
+    """
+
+    def __init__(self, name, time, elapsed_str, freq, gain, azimuth, elevation, extra_data):
+        for value, expected in ((name, str), (time, datetime), (elapsed_str, str), (freq, float), (gain, str), (azimuth, float), (elevation, float), (extra_data, dict)):
+            if not isinstance(value, expected):
+                raise ValueError(f"{value} must be a {expected}")
+        for key in extra_data:
+            if not isinstance(extra_data[key], (str, int, float)):
+                raise ValueError(f"Extra data {extra_data[key]} must be a string, int or float")
+
+        self.name = name
+        self.time = time
+        self.elapsed_str = elapsed_str
+        self.freq = freq
+        self.gain = gain
+        self.azimuth = azimuth
+        self.elevation = elevation
+        self.extra_data = extra_data
+
+
+def build(factory, count):
+    """
+    Creates count events with factory, returns them and the time it took
+    """
+    now = datetime.now()
+    extra_data = {"dbfs": -42.5, "demodulator_mode": "FM", "squelch_threshold": -150.0}
+
+    start = time.perf_counter()
+    events = [factory("Beacon", now, "01:23", 437000000.0, "30", 180.5, 45.2, extra_data) for _ in range(count)]
+    return events, time.perf_counter() - start
+
+
+def measure(name, factory, count):
+    """
+    Prints the construction time and the memory used per event
+    the time is measured without tracemalloc, since tracing slows every allocation down
+    """
+    _, elapsed = build(factory, count)
+
+    tracemalloc.start()
+    events, _ = build(factory, count)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # the list itself is the same for every factory, only the events are counted
+    memory -= sys.getsizeof(events)
+
+    print(f"{name:<20} {elapsed / count * 1e9:8.0f} ns/event {memory / count:8.1f} bytes/event")
+    return elapsed, memory
+
+
+if __name__ == "__main__":
+
+    count = 200000
+    print(f"Building {count} events\n")
+
+    plain_time, plain_memory = measure("plain", PlainEvent, count)
+    slotted_time, slotted_memory = measure("slotted", Event, count)
+    trusted_time, trusted_memory = measure("slotted trusted", Event.trusted, count)
+
+    print()
+    print(f"Memory per event:  {plain_memory / slotted_memory:.1f}x smaller than plain")
+    print(f"Construction time: {plain_time / slotted_time:.1f}x faster validated, {plain_time / trusted_time:.1f}x faster trusted")
@@ -0,0 +1,129 @@
+"""
+Small benchmark for the rpc transports
+It starts a server for every case in this process, registers a function that returns a reply shaped like
+get_radio_info and calls it from a few client threads, each with its own proxy like the manager does
+    baseline - plain SimpleXMLRPCServer behind a plain ServerProxy, a new connection per call (what the repo started with)
+    xmlrpc   - threaded xmlrpc server behind the PooledTransport of rpc_client, the connection is kept open
+    tcp      - fast_rpc over a tcp connection that is kept open
+    unix     - fast_rpc over a unix domain socket
+and reports the calls per second and the p50 and p99 latency of a single call
+
+assuming that we are running this file from the repo root folder
+    python tools/bench_rpc.py
+    python tools/bench_rpc.py --calls 5000 --clients 4
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import xmlrpc.client
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from rpc_client import create_rpc_proxy
+from rpc_server import create_rpc_server
+
+
+RADIO_INFO = {
+    "frequency": 437000000.0,
+    "demodulator_mode": "FM",
+    "passband": 10000.0,
+    "dbfs": -42.5,
+    "squelch_threshold": -150.0,
+    "gain": "LNA=30",
+    "recording_status": 1,
+    "stale_fields": "",
+}
+
+
+# name : (transport, server mode)
+CASES = {
+    "baseline": ("xmlrpc", "simple"),
+    "xmlrpc": ("xmlrpc", "threaded"),
+    "tcp": ("tcp", "threaded"),
+    "unix": ("unix", "threaded"),
+}
+
+
+def get_radio_info():
+    return RADIO_INFO
+
+
+def create_proxy(case, port, unix_folder):
+    """
+    The baseline uses the stdlib ServerProxy, everything else the proxies of rpc_client
+    """
+    if case == "baseline":
+        return xmlrpc.client.ServerProxy(f"http://localhost:{port}/")
+    return create_rpc_proxy("localhost", port, CASES[case][0], unix_folder)
+
+
+def run_clients(case, port, unix_folder, calls, clients):
+    """
+    Calls get_radio_info calls times from every client thread
+    returns the latency of every call in seconds and the total time
+    """
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        proxy = create_proxy(case, port, unix_folder)
+        proxy.get_radio_info()      # the first call opens the connection, it is not measured
+        own = []
+        for _ in range(calls):
+            start = time.perf_counter()
+            proxy.get_radio_info()
+            own.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - start
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def bench(case, port, unix_folder, calls, clients):
+    transport, mode = CASES[case]
+    server = create_rpc_server("localhost", port, mode, transport=transport, unix_folder=unix_folder)
+    server.register_function(get_radio_info)
+    server.logRequests = False      # writing a log line per call to the terminal would be measured as well
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        latencies, elapsed = run_clients(case, port, unix_folder, calls, clients)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    print(f"{case:8} {len(latencies) / elapsed:10.0f} calls/s   p50 {percentile(latencies, 0.5) * 1000:7.3f} ms   p99 {percentile(latencies, 0.99) * 1000:7.3f} ms")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Compares the calls per second and latency of the rpc transports")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES), help="cases to run, all by default")
+    parser.add_argument("--calls", type=int, default=2000, help="calls made by every client")
+    parser.add_argument("--clients", type=int, default=1, help="number of client threads")
+    parser.add_argument("--port", type=int, default=17100, help="first port used by the servers")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_arguments()
+
+    print(f"{args.calls} calls from {args.clients} clients")
+    with tempfile.TemporaryDirectory() as unix_folder:
+        for offset, case in enumerate(args.cases):
+            bench(case, args.port + offset, unix_folder, args.calls, args.clients)
@@ -1,8 +1,11 @@
 """
 This will store some common features that will be used by the tools
 """
+import argparse
 import json
 import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 
 def get_json_list(json_folder="passage_metadata"):
     """
@@ -18,6 +21,8 @@ def get_json_list(json_folder="passage_metadata"):
 def load_data(json_file_path):
     """
     Gets the file path related to a certain passage, will load the file and return a dictionary
+    the whole passage is in memory, it is what the migrations and cut_iq need since they change it and write it back,
+    tools that only read the events should use iter_passage
     """
     
     try:
@@ -28,17 +33,114 @@ def load_data(json_file_path):
         return {}
     return data
 
+def iter_passage(json_file_path, chunk_size=65536):
+    """
+    Reads a passage file without loading it all into memory
+    yields ("header", key, value) for every top level field and ("event", event_dict) for every event in event_list,
+    in the order they are in the file. Only one event is in memory at a time, so this works for passages of any size
+    (for now only passage_index reads this way, see load_data)
+    
+        for item in iter_passage(path):
+            if item[0] == "event":
+                ...
+    """
+    decoder = json.JSONDecoder()
+    
+    with open(json_file_path, "r") as file:
+        buffer = ""
+        position = 0
+        end_of_file = False
+        
+        def fill():
+            # drops what was already parsed and reads the next chunk, returns False at the end of the file
+            nonlocal buffer, position, end_of_file
+            chunk = file.read(chunk_size)
+            buffer = buffer[position:] + chunk
+            position = 0
+            end_of_file = not chunk
+            return not end_of_file
+        
+        def next_char():
+            # skips white space and returns the next character without consuming it
+            nonlocal position
+            while True:
+                while position < len(buffer) and buffer[position] in " \t\r\n":
+                    position += 1
+                if position < len(buffer):
+                    return buffer[position]
+                if not fill():
+                    raise ValueError(f"{json_file_path} ended unexpectedly")
+        
+        def expect(characters):
+            nonlocal position
+            char = next_char()
+            if char not in characters:
+                raise ValueError(f"{json_file_path} expected one of {characters!r} but found {char!r}")
+            position += 1
+            return char
+        
+        def value():
+            # decodes the next json value, reading more of the file until it is complete
+            nonlocal position
+            next_char()
+            while True:
+                try:
+                    result, end = decoder.raw_decode(buffer, position)
+                    # a number that ends with the buffer may continue in the next chunk
+                    if end < len(buffer) or end_of_file or not fill():
+                        position = end
+                        return result
+                except json.JSONDecodeError:
+                    if not fill():
+                        raise
+        
+        expect("{")
+        if next_char() == "}":
+            return
+        
+        while True:
+            key = value()
+            expect(":")
+            
+            if key == "event_list" and next_char() == "[":
+                expect("[")
+                if next_char() == "]":
+                    expect("]")
+                else:
+                    while True:
+                        yield ("event", value())
+                        if expect(",]") == "]":
+                            break
+            else:
+                yield ("header", key, value())
+            
+            if expect(",}") == "}":
+                return
+
 def dump_data(data, json_file_path):
     """
     Give a data dictionary and a file path. It will dump the dictioanry into the file path
     return true if it was succesfull false otherwise
+    
+    The data is written to a temporary file in the same folder that is then renamed over the original,
+    so an interrupted dump never leaves a half written file behind
     """
     
+    temp_path = None
     try:
-        with open(json_file_path, "w") as file:
+        folder = os.path.dirname(json_file_path) or "."
+        with tempfile.NamedTemporaryFile("w", dir=folder, suffix=".tmp", delete=False) as file:
+            temp_path = file.name
             json.dump(data, file, indent=4)
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(json_file_path):
+            os.chmod(temp_path, os.stat(json_file_path).st_mode)    # the temporary file is created private
+        os.replace(temp_path, json_file_path)
     except Exception as E:
         print(f"[ERROR] - dump_data {json_file_path} - {E}")
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
         return False
 
     return True
@@ -56,4 +158,113 @@ def check_elapsed_time(data_dict):
         if "elapsed_time" not in evn:
             return False
     
-    return True
\ No newline at end of file
+    return True
+
+"""
+Migrations
+A migration is a (name, function) pair. The function receives the data of a passage, changes it in place
+and returns True when something was changed. run_migrations applies a list of them to every passage.
+
+Which migrations were applied to each file is recorded in a state file inside the passage folder,
+together with the modification time and size of the file, so a file that did not change since
+is skipped without being opened.
+"""
+
+MIGRATION_STATE_FILE = ".migration_state"    # no .json extension, so get_json_list does not take it for a passage
+
+
+def load_migration_state(json_folder):
+    """
+    Returns the migration state of the folder, {file name: {"mtime", "size", "applied"}}
+    """
+    state_path = os.path.join(json_folder, MIGRATION_STATE_FILE)
+    if not os.path.exists(state_path):
+        return {}
+    return load_data(state_path)
+
+
+def migrate_file(json_file_path, migrations, dry_run):
+    """
+    Applies the migrations to a single file, runs in a worker process
+    returns the names of the migrations that changed the file, or None if the file could not be loaded or migrated
+    """
+    data = load_data(json_file_path)
+    if not data:
+        return None
+
+    try:
+        changed = [name for name, function in migrations if function(data)]
+    except Exception as E:
+        print(f"[ERROR] - migrate_file {json_file_path} - {E}")
+        return None
+
+    if changed and not dry_run:
+        if not dump_data(data, json_file_path):
+            return None
+
+    return changed
+
+
+def run_migrations(migrations, json_folder="passage_metadata", dry_run=False, workers=None):
+    """
+    Applies every migration to every passage in json_folder using a pool of worker processes
+    With dry_run nothing is written, it only reports which files would be changed
+    returns a dictionary {file name: names of the migrations that changed it}
+    """
+    json_list, json_path_list = get_json_list(json_folder)
+    state = load_migration_state(json_folder)
+    names = [name for name, _ in migrations]
+
+    # find the files that still need at least one of the migrations
+    todo = []
+    for json_name, json_file_path in zip(json_list, json_path_list):
+        stat = os.stat(json_file_path)
+        file_state = state.get(json_name)
+        if file_state and file_state["mtime"] == stat.st_mtime and file_state["size"] == stat.st_size:
+            pending = [migration for migration in migrations if migration[0] not in file_state["applied"]]
+        else:
+            # new or changed since the last run, it is not known what it already has
+            pending = migrations
+            file_state = {"applied": []}
+
+        if pending:
+            todo.append((json_name, json_file_path, pending, file_state))
+
+    print(f"{len(todo)} of {len(json_list)} files need {', '.join(names)}")
+
+    results = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = executor.map(migrate_file, [item[1] for item in todo], [item[2] for item in todo], [dry_run] * len(todo), chunksize=32)
+
+            for (json_name, json_file_path, pending, file_state), changed in zip(todo, futures):
+                if changed is None:
+                    print(f"  {json_name} - failed")
+                    continue
+
+                if changed:
+                    print(f"  {json_name} - {'would apply' if dry_run else 'applied'} {', '.join(changed)}")
+                    results[json_name] = changed
+
+                stat = os.stat(json_file_path)
+                applied = file_state["applied"] + [name for name, _ in pending if name not in file_state["applied"]]
+                state[json_name] = {"mtime": stat.st_mtime, "size": stat.st_size, "applied": applied}
+    finally:
+        # saved even when the run is interrupted, so the files that were already rewritten are not migrated again
+        if not dry_run:
+            # forget the files that are gone
+            state = {json_name: file_state for json_name, file_state in state.items() if json_name in json_list}
+            dump_data(state, os.path.join(json_folder, MIGRATION_STATE_FILE))
+
+    return results
+
+
+def parse_migration_arguments(description):
+    """
+    Command line arguments shared by the migration scripts
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--folder", default="passage_metadata", help="folder with the passage jsons")
+    parser.add_argument("--dry-run", action="store_true", help="only report the files that would be changed")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes, defaults to the number of cpus")
+    return parser.parse_args()
@@ -0,0 +1,207 @@
+"""
+This script cuts the iq recording of a passage into one clip per event
+Each clip goes from pre seconds before the event to post seconds after it, the offset of the event in the recording
+is the time between the start of the recording and the event (falls back to elapsed_time for old passages)
+The iq recording is started together with the passage, so its first sample is taken as start_record_time.
+
+The sample rate and format are read from the gqrx file name (gqrx_20241015_123456_437000000_2000000_fc.raw)
+The clips are copied inside the kernel (copy_file_range or sendfile) when possible, otherwise written straight from
+a memory map of the recording, so a multi GB recording is never read through python buffers.
+The clips are cut in parallel by a pool of worker processes.
+
+The name of each clip is saved in the cutted field of its event
+
+assuming that we are running this file from the repo root folder
+    python tools/cut_iq.py passage_metadata/passage.json /path/to/gqrx_20241015_123456_437000000_2000000_fc.raw
+    python tools/cut_iq.py passage.json recording.raw --pre 10 --post 20 --out clips --workers 4 [--dry-run] [--force]
+"""
+
+import argparse
+import datetime
+import errno
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from common import dump_data, load_data
+
+
+# bytes per sample of each gqrx format, fc is complex float32 (two 4 byte floats)
+SAMPLE_SIZES = {"fc": 8}
+
+GQRX_NAME = re.compile(r"gqrx_(\d{8})_(\d{6})_(\d+)_(\d+)_(\w+?)(?:_|\.|$)")
+
+COPY_CHUNK = 64 * 1024 * 1024      # bytes copied per call
+
+
+def parse_iq_name(iq_file_path):
+    """
+    Reads the recording information from a gqrx iq file name
+    returns a dictionary with the start (as written by gqrx), center frequency, sample rate and sample size in bytes
+    """
+    match = GQRX_NAME.search(os.path.basename(iq_file_path))
+    if match is None:
+        raise ValueError(f"{iq_file_path} is not a gqrx iq file name")
+
+    date, time, frequency, sample_rate, sample_format = match.groups()
+    if sample_format not in SAMPLE_SIZES:
+        raise ValueError(f"{iq_file_path} unknown sample format {sample_format}")
+
+    return {
+        "start": datetime.datetime.strptime(date + time, "%Y%m%d%H%M%S"),
+        "frequency": int(frequency),
+        "sample_rate": int(sample_rate),
+        "sample_size": SAMPLE_SIZES[sample_format],
+    }
+
+
+def event_offset(data, evn):
+    """
+    Seconds between the start of the recording and the event
+    """
+    if "time" in evn and "start_record_time" in data:
+        start_time = datetime.datetime.fromisoformat(data["start_record_time"])
+        return (datetime.datetime.fromisoformat(evn["time"]) - start_time).total_seconds()
+
+    minutes, seconds = evn["elapsed_time"].split(":")
+    return int(minutes) * 60 + int(seconds)
+
+
+def plan_clips(data, iq_file_path, output_folder, pre, post):
+    """
+    Works out the byte range of the clip of every event, clamped to the recording
+    returns a list of (event index, clip path, start byte, length in bytes), events outside of the recording are left out
+    """
+    info = parse_iq_name(iq_file_path)
+    bytes_per_second = info["sample_rate"] * info["sample_size"]
+    file_size = os.path.getsize(iq_file_path)
+    stem = os.path.splitext(os.path.basename(iq_file_path))[0]
+
+    clips = []
+    for index, evn in enumerate(data["event_list"]):
+        offset = event_offset(data, evn)
+
+        # whole samples only, a clip that starts in the middle of a sample would be garbage
+        start = max(int((offset - pre) * info["sample_rate"]), 0) * info["sample_size"]
+        end = min(int((offset + post) * info["sample_rate"]) * info["sample_size"], file_size - file_size % info["sample_size"])
+        if end <= start:
+            print(f"  event {index} {evn.get('name')} at {offset:.1f}s is outside of the recording ({file_size / bytes_per_second:.1f}s)")
+            continue
+
+        name = re.sub(r"\W+", "_", evn.get("name", "event"))
+        clip_path = os.path.join(output_folder, f"{stem}_event{index:03}_{name}.raw")
+        clips.append((index, clip_path, start, end - start))
+
+    return clips
+
+
+def copy_range(source, destination, start, length):
+    """
+    Copies length bytes starting at start from the source file descriptor to the destination one
+    without passing the data through python, returns False when the system can not do it
+    """
+    if not hasattr(os, "copy_file_range") and not hasattr(os, "sendfile"):
+        return False
+
+    copied = 0
+    while copied < length:
+        count = min(COPY_CHUNK, length - copied)
+        try:
+            if hasattr(os, "copy_file_range"):
+                done = os.copy_file_range(source, destination, count, start + copied)
+            else:
+                done = os.sendfile(destination, source, start + copied, count)
+        except OSError as E:
+            # not supported between these files (different file systems for example), the memory map is used instead
+            if copied == 0 and E.errno in (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+                return False
+            raise
+        if done == 0:
+            raise OSError(f"Recording ended after {copied} of {length} bytes")
+        copied += done
+
+    return True
+
+
+def cut_clip(iq_file_path, clip_path, start, length):
+    """
+    Writes a single clip, runs in a worker process
+    returns the clip path
+    """
+    with open(iq_file_path, "rb") as source, open(clip_path, "wb") as destination:
+        if copy_range(source.fileno(), destination.fileno(), start, length):
+            return clip_path
+
+        # the mapping has to start at a multiple of the page size
+        map_start = start - start % mmap.ALLOCATIONGRANULARITY
+        with mmap.mmap(source.fileno(), length + start - map_start, access=mmap.ACCESS_READ, offset=map_start) as recording:
+            view = memoryview(recording)
+            position = start - map_start
+            while position < len(view):
+                position += destination.write(view[position:position + COPY_CHUNK])
+            view.release()
+
+    return clip_path
+
+
+def cut_passage(json_file_path, iq_file_path, output_folder=None, pre=5.0, post=5.0, workers=None, dry_run=False, force=False):
+    """
+    Cuts a clip for every event of the passage that does not have one yet and saves the clip names in the passage
+    returns the number of clips that were cut
+    """
+    data = load_data(json_file_path)
+    if not data:
+        return 0
+
+    if output_folder is None:
+        output_folder = os.path.join(os.path.dirname(os.path.abspath(iq_file_path)), f"{os.path.splitext(os.path.basename(iq_file_path))[0]}_clips")
+
+    clips = plan_clips(data, iq_file_path, output_folder, pre, post)
+    if not force:
+        clips = [clip for clip in clips if not data["event_list"][clip[0]].get("cutted")]
+
+    print(f"{len(clips)} clips to cut from {iq_file_path} into {output_folder}")
+    for index, clip_path, start, length in clips:
+        print(f"  event {index} - {os.path.basename(clip_path)} ({length / 1024 / 1024:.1f} MB)")
+
+    if dry_run or not clips:
+        return 0
+
+    os.makedirs(output_folder, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(cut_clip, iq_file_path, clip_path, start, length) for _, clip_path, start, length in clips]
+
+        cut = 0
+        for (index, clip_path, _, _), future in zip(clips, futures):
+            try:
+                future.result()
+            except Exception as E:
+                print(f"[ERROR] - cut_clip {clip_path} - {E}")
+                continue
+            data["event_list"][index]["cutted"] = os.path.relpath(clip_path, os.path.dirname(os.path.abspath(json_file_path)))
+            cut += 1
+
+    dump_data(data, json_file_path)
+    return cut
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Cuts the iq recording of a passage into one clip per event")
+    parser.add_argument("passage", help="passage json")
+    parser.add_argument("iq_file", help="gqrx iq recording of the passage")
+    parser.add_argument("--pre", type=float, default=5.0, help="seconds kept before each event")
+    parser.add_argument("--post", type=float, default=5.0, help="seconds kept after each event")
+    parser.add_argument("--out", default=None, help="folder for the clips, defaults to <iq file>_clips next to the recording")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes, defaults to the number of cpus")
+    parser.add_argument("--dry-run", action="store_true", help="only report the clips that would be cut")
+    parser.add_argument("--force", action="store_true", help="cut again the events that already have a clip")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_arguments()
+
+    cut = cut_passage(args.passage, args.iq_file, args.out, args.pre, args.post, args.workers, args.dry_run, args.force)
+    print(f"Cut {cut} clips")
@@ -0,0 +1,188 @@
+"""
+This script computes a spectral summary of the iq recording of a passage
+    - a waterfall, the averaged power spectrum (welch, hann window) of every row of --row seconds
+    - the power spectrum of the whole recording
+    - for every event, the snr of the strongest bin around the event and its frequency
+
+The recording is read through a numpy memory map one block of rows at a time, so it is never loaded into memory,
+and the rows are split between a pool of worker processes.
+The results are written in the spectrum folder next to the passage json, so get_json_list does not take them for passages:
+    spectrum/<passage>.npz   - waterfall (rows x bins, dB), row_times (s), frequencies (Hz), psd (dB)
+    spectrum/<passage>.json  - recording information and the snr of every event
+
+numpy is needed for this script, it is not needed by the rest of logBook
+
+assuming that we are running this file from the repo root folder
+    python tools/iq_spectrum.py passage_metadata/passage.json /path/to/gqrx_20241015_123456_437000000_2000000_fc.raw
+    python tools/iq_spectrum.py passage.json recording.raw --fft 2048 --row 0.25 --window 2 --workers 4
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from common import load_data
+from cut_iq import event_offset, parse_iq_name
+
+
+BLOCK_SAMPLES = 8 * 1024 * 1024     # samples read from the memory map at once, bounds the memory used by each worker
+
+SPECTRUM_FOLDER = "spectrum"        # a folder and not <passage>_spectrum.json, that would be listed as a passage
+
+
+def spectrum_rows(iq_file_path, total_samples, first_row, last_row, row_samples, fft_size):
+    """
+    Computes the waterfall rows [first_row, last_row) of the recording, runs in a worker process
+    total_samples is the number of whole samples, a recording that was cut in the middle of a sample has a few bytes more
+    every row is the mean of the power spectra of its fft_size segments (no overlap), in linear units
+    returns an array of (last_row - first_row, fft_size) float32
+    """
+    recording = np.memmap(iq_file_path, dtype=np.complex64, mode="r", shape=(total_samples,))
+    window = np.hanning(fft_size).astype(np.float32)
+    # the window takes power away from the signal, dividing by this keeps the levels comparable between fft sizes
+    scale = np.float32(1.0 / (window ** 2).sum())
+
+    segments_per_row = row_samples // fft_size
+    rows_per_block = max(BLOCK_SAMPLES // row_samples, 1)
+
+    result = np.empty((last_row - first_row, fft_size), dtype=np.float32)
+    for block_start in range(first_row, last_row, rows_per_block):
+        block_rows = min(rows_per_block, last_row - block_start)
+        start = block_start * row_samples
+        # rows x segments x fft_size, the end of each row that does not fill a segment is left out
+        block = recording[start:start + block_rows * row_samples].reshape(block_rows, row_samples)
+        segments = block[:, :segments_per_row * fft_size].reshape(block_rows, segments_per_row, fft_size)
+
+        spectrum = np.fft.fft(segments * window, axis=2)
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+        result[block_start - first_row:block_start - first_row + block_rows] = np.fft.fftshift(power.mean(axis=1) * scale, axes=1)
+
+    del recording
+    return result
+
+
+def to_db(power):
+    """
+    Converts linear power to dB, zeros become a very low level instead of -inf
+    """
+    return 10 * np.log10(np.maximum(power, 1e-20))
+
+
+def event_snr(waterfall, row_seconds, frequencies, offset, window):
+    """
+    Estimates the snr of an event from the waterfall rows up to window seconds around it
+    the signal is the strongest bin of the averaged spectrum and the noise is the median bin, which is mostly noise
+    for the narrow signals of a satellite passage. Returns None when the event is outside of the recording
+    """
+    first = max(int((offset - window) / row_seconds), 0)
+    last = min(int((offset + window) / row_seconds) + 1, len(waterfall))
+    if last <= first:
+        return None
+
+    spectrum = waterfall[first:last].mean(axis=0)
+    peak = int(spectrum.argmax())
+    noise = float(np.median(spectrum))
+    return {
+        "snr_db": float(to_db(spectrum[peak] / noise)) if noise > 0 else 0.0,
+        "peak_frequency": float(frequencies[peak]),
+        "peak_db": float(to_db(spectrum[peak])),
+        "noise_db": float(to_db(noise)),
+    }
+
+
+def analyse_passage(json_file_path, iq_file_path, fft_size=1024, row_seconds=0.5, window=2.0, workers=None):
+    """
+    Computes the spectral summary of the recording and the snr of every event of the passage and writes them
+    to the spectrum folder next to the passage
+    returns the path of the json summary
+    """
+    data = load_data(json_file_path)
+    if not data:
+        return None
+
+    info = parse_iq_name(iq_file_path)
+    sample_rate = info["sample_rate"]
+    total_samples = os.path.getsize(iq_file_path) // info["sample_size"]
+
+    # rows are a whole number of segments, so every row averages the same number of spectra
+    row_samples = max(int(row_seconds * sample_rate) // fft_size, 1) * fft_size
+    row_seconds = row_samples / sample_rate
+    rows = total_samples // row_samples
+    if rows == 0:
+        print(f"{iq_file_path} is shorter than a single row")
+        return None
+
+    workers = workers or os.cpu_count()
+    # a few ranges per worker, so a slow worker does not hold the others back at the end
+    ranges = max(min(workers * 4, rows), 1)
+    bounds = [rows * i // ranges for i in range(ranges + 1)]
+
+    print(f"{rows} rows of {row_seconds:.3f}s, {fft_size} bins, {ranges} ranges on {workers} workers")
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        parts = executor.map(spectrum_rows, [iq_file_path] * ranges, [total_samples] * ranges, bounds[:-1], bounds[1:], [row_samples] * ranges, [fft_size] * ranges)
+        waterfall = np.concatenate(list(parts))
+    elapsed = time.perf_counter() - started
+
+    recording_seconds = rows * row_seconds
+    print(f"Processed {recording_seconds:.1f}s of iq in {elapsed:.1f}s ({recording_seconds / elapsed:.1f}x real time)")
+
+    frequencies = info["frequency"] + np.fft.fftshift(np.fft.fftfreq(fft_size, 1 / sample_rate))
+    row_times = np.arange(rows) * row_seconds
+
+    events = []
+    for index, evn in enumerate(data["event_list"]):
+        offset = event_offset(data, evn)
+        events.append({"index": index, "name": evn.get("name"), "time": evn.get("time"), "offset": offset,
+                       "snr": event_snr(waterfall, row_seconds, frequencies, offset, window)})
+
+    spectrum_folder = os.path.join(os.path.dirname(os.path.abspath(json_file_path)), SPECTRUM_FOLDER)
+    os.makedirs(spectrum_folder, exist_ok=True)
+    base_path = os.path.join(spectrum_folder, os.path.splitext(os.path.basename(json_file_path))[0])
+    np.savez_compressed(base_path + ".npz", waterfall=to_db(waterfall).astype(np.float32), row_times=row_times,
+                        frequencies=frequencies, psd=to_db(waterfall.mean(axis=0)))
+
+    summary = {
+        "iq_file": os.path.basename(iq_file_path),
+        "center_frequency": info["frequency"],
+        "sample_rate": sample_rate,
+        "fft_size": fft_size,
+        "row_seconds": row_seconds,
+        "rows": rows,
+        "event_window": window,
+        "event_list": events,
+    }
+    with open(base_path + ".json", "w") as file:
+        json.dump(summary, file, indent=4)
+
+    return base_path + ".json"
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Computes the waterfall, power spectrum and event snr of the iq recording of a passage")
+    parser.add_argument("passage", help="passage json")
+    parser.add_argument("iq_file", help="gqrx iq recording of the passage")
+    parser.add_argument("--fft", type=int, default=1024, help="number of frequency bins")
+    parser.add_argument("--row", type=float, default=0.5, help="seconds of iq averaged into each waterfall row")
+    parser.add_argument("--window", type=float, default=2.0, help="seconds around each event used for its snr")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes, defaults to the number of cpus")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_arguments()
+
+    if np is None:
+        raise SystemExit("iq_spectrum needs numpy, install it with: pip install numpy")
+
+    summary_path = analyse_passage(args.passage, args.iq_file, args.fft, args.row, args.window, args.workers)
+    if summary_path is not None:
+        print(f"Spectrum written to {summary_path}")
@@ -0,0 +1,242 @@
+"""
+This script keeps an index of all the passages in passage_metadata so they can be searched without reading every json
+The index is a sqlite database inside the passage folder. Updating it only parses the files that are new
+or whose modification time or size changed since the last update, and forgets the files that were removed.
+
+It can be used from python:
+    index = PassageIndex()
+    index.update()
+    index.query_events(name="Beacon", min_elevation=30, since="2024-10-01")
+
+or from the command line, assuming that we are running this file from the repo root folder:
+    python tools/passage_index.py update
+    python tools/passage_index.py events --name Beacon --min-elevation 30 --since 2024-10-01
+    python tools/passage_index.py passages --since 2024-10-01
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+
+from common import get_json_list, iter_passage
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS passages (
+    file TEXT PRIMARY KEY,
+    mtime REAL,
+    size INTEGER,
+    start_record_time TEXT,
+    end_record_time TEXT,
+    event_count INTEGER
+);
+CREATE TABLE IF NOT EXISTS events (
+    file TEXT,
+    name TEXT,
+    time TEXT,
+    elapsed_time TEXT,
+    freq REAL,
+    azimuth REAL,
+    elevation REAL
+);
+CREATE INDEX IF NOT EXISTS events_file ON events (file);
+CREATE INDEX IF NOT EXISTS events_name_time ON events (name, time);
+CREATE INDEX IF NOT EXISTS events_time ON events (time);
+CREATE INDEX IF NOT EXISTS passages_start ON passages (start_record_time);
+"""
+
+
+class PassageIndex:
+    """
+    Index over the passage jsons, times are stored as the iso strings of the jsons so they sort correctly
+    """
+
+    def __init__(self, json_folder="passage_metadata", index_path=None):
+        self.json_folder = json_folder
+        self.index_path = index_path or os.path.join(json_folder, "index.sqlite3")
+
+        self.connection = sqlite3.connect(self.index_path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def update(self):
+        """
+        Brings the index up to date with the json folder
+        returns the number of files that were indexed, removed and left untouched
+        """
+        json_list, json_path_list = get_json_list(self.json_folder)
+
+        known = {row["file"]: (row["mtime"], row["size"]) for row in self.connection.execute("SELECT file, mtime, size FROM passages")}
+
+        indexed = 0
+        skipped = 0
+        with self.connection:
+            for json_name, json_file_path in zip(json_list, json_path_list):
+                stat = os.stat(json_file_path)
+                if known.pop(json_name, None) == (stat.st_mtime, stat.st_size):
+                    skipped += 1
+                    continue
+
+                # the events are inserted while the file is streamed, a file that fails half way is rolled back
+                # to the savepoint, so none of its rows are committed and the previous index of it is kept
+                self.connection.execute("SAVEPOINT passage")
+                try:
+                    self.index_passage(json_name, json_file_path, stat)
+                except Exception as E:
+                    print(f"[ERROR] - index {json_file_path} - {E}")
+                    self.connection.execute("ROLLBACK TO passage")
+                    continue
+                finally:
+                    self.connection.execute("RELEASE passage")
+                indexed += 1
+
+            # whatever is left in known is no longer in the folder
+            for json_name in known:
+                self.remove_passage(json_name)
+
+        return indexed, len(known), skipped
+
+    def remove_passage(self, json_name):
+        """
+        Removes a passage and its events from the index
+        """
+        self.connection.execute("DELETE FROM events WHERE file = ?", (json_name,))
+        self.connection.execute("DELETE FROM passages WHERE file = ?", (json_name,))
+
+    def index_passage(self, json_name, json_file_path, stat):
+        """
+        (Re)indexes a single passage, the file is streamed so big passages are not loaded into memory
+        """
+        self.remove_passage(json_name)
+
+        header = {}
+        event_count = 0
+        batch = []
+        for item in iter_passage(json_file_path):
+            if item[0] == "header":
+                header[item[1]] = item[2]
+                continue
+
+            evn = item[1]
+            batch.append((json_name, evn.get("name"), evn.get("time"), evn.get("elapsed_time"), evn.get("freq"), evn.get("azimuth"), evn.get("elevation")))
+            event_count += 1
+            if len(batch) >= 1000:
+                self.connection.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+                batch = []
+
+        self.connection.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+        self.connection.execute(
+            "INSERT INTO passages VALUES (?, ?, ?, ?, ?, ?)",
+            (json_name, stat.st_mtime, stat.st_size, header.get("start_record_time"), header.get("end_record_time"), event_count),
+        )
+
+    def query_events(self, name=None, since=None, until=None, min_elevation=None, max_elevation=None,
+                     min_azimuth=None, max_azimuth=None, min_freq=None, max_freq=None):
+        """
+        Returns the events that match every given filter as a list of dictionaries
+        since and until are iso date strings (2024-10-01 or 2024-10-01T12:00:00), until is exclusive
+        """
+        conditions = []
+        parameters = []
+        for column, operator, value in (
+            ("name", "=", name),
+            ("time", ">=", since),
+            ("time", "<", until),
+            ("elevation", ">=", min_elevation),
+            ("elevation", "<=", max_elevation),
+            ("azimuth", ">=", min_azimuth),
+            ("azimuth", "<=", max_azimuth),
+            ("freq", ">=", min_freq),
+            ("freq", "<=", max_freq),
+        ):
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                parameters.append(value)
+
+        query = "SELECT * FROM events"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY time"
+
+        return [dict(row) for row in self.connection.execute(query, parameters)]
+
+    def query_passages(self, since=None, until=None):
+        """
+        Returns the passages that started in the given period as a list of dictionaries
+        """
+        conditions = []
+        parameters = []
+        if since is not None:
+            conditions.append("start_record_time >= ?")
+            parameters.append(since)
+        if until is not None:
+            conditions.append("start_record_time < ?")
+            parameters.append(until)
+
+        query = "SELECT * FROM passages"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY start_record_time"
+
+        return [dict(row) for row in self.connection.execute(query, parameters)]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Index and search the passages in passage_metadata")
+    parser.add_argument("--folder", default="passage_metadata", help="folder with the passage jsons")
+    parser.add_argument("--json", action="store_true", help="print the results as json")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("update", help="index new and changed passages")
+
+    events = subparsers.add_parser("events", help="search events")
+    events.add_argument("--name")
+    events.add_argument("--since")
+    events.add_argument("--until")
+    events.add_argument("--min-elevation", type=float)
+    events.add_argument("--max-elevation", type=float)
+    events.add_argument("--min-azimuth", type=float)
+    events.add_argument("--max-azimuth", type=float)
+    events.add_argument("--min-freq", type=float)
+    events.add_argument("--max-freq", type=float)
+
+    passages = subparsers.add_parser("passages", help="search passages")
+    passages.add_argument("--since")
+    passages.add_argument("--until")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_arguments()
+
+    index = PassageIndex(args.folder)
+
+    # searches always run on an up to date index, only changed files are parsed so this is cheap
+    indexed, removed, skipped = index.update()
+    if args.command == "update":
+        print(f"Indexed {indexed} passages, removed {removed}, {skipped} unchanged")
+        index.close()
+        raise SystemExit(0)
+
+    if args.command == "events":
+        results = index.query_events(args.name, args.since, args.until, args.min_elevation, args.max_elevation,
+                                     args.min_azimuth, args.max_azimuth, args.min_freq, args.max_freq)
+    else:
+        results = index.query_passages(args.since, args.until)
+
+    index.close()
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    elif args.command == "events":
+        for evn in results:
+            print(f"{evn['time']}  {evn['name']:<12} {evn['freq']}  az {evn['azimuth']}  el {evn['elevation']}  ({evn['file']})")
+    else:
+        for passage in results:
+            print(f"{passage['start_record_time']} -> {passage['end_record_time']}  {passage['event_count']} events  ({passage['file']})")
@@ -0,0 +1,170 @@
+"""
+The idea of this file is to store the continuous history of a passage (rotor pointing and signal strength)
+Unlike the events, that are only a handful per passage, the track is sampled a few times per second,
+so it is kept in arrays, one per column, and dumped to a binary file that can be memory mapped
+"""
+
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+
+
+class Track:
+    """
+    Columnar storage of the track samples, every column is an array.
+    Time and frequency need doubles to keep their precision, the angles and dbfs fit in floats.
+    Missing values are stored as nan.
+
+    File format (little endian):
+        8 bytes    magic, b"LBTRACK1"
+        8 bytes    number of samples (unsigned)
+        then every column in COLUMNS order, number of samples values of the column type each
+    """
+
+    MAGIC = b"LBTRACK1"
+    HEADER = struct.Struct("<8sQ")
+    COLUMNS = ("time", "azimuth", "elevation", "dbfs", "frequency")
+    TYPES = {"time": "d", "azimuth": "f", "elevation": "f", "dbfs": "f", "frequency": "d"}    # array type codes
+
+    def __init__(self, columns=None):
+        """
+        columns can be given to wrap data that was already loaded, otherwise the track starts empty
+        """
+        if columns is None:
+            columns = {name: array(self.TYPES[name]) for name in self.COLUMNS}
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns["time"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def append(self, timestamp, azimuth, elevation, dbfs, frequency):
+        """
+        Adds one sample to the track, None values are stored as nan
+        timestamp is a unix timestamp in seconds
+        """
+        for name, value in zip(self.COLUMNS, (timestamp, azimuth, elevation, dbfs, frequency)):
+            self.columns[name].append(float("nan") if value is None else value)
+
+    def dump(self, file_path):
+        """
+        Writes the track to file_path in the binary format described in the class
+        """
+        with open(file_path, "wb") as file:
+            file.write(self.HEADER.pack(self.MAGIC, len(self)))
+            for name in self.COLUMNS:
+                column = self.columns[name]
+                if sys.byteorder != "little":
+                    column = array(self.TYPES[name], column)
+                    column.byteswap()
+                column.tofile(file)
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        Memory maps a dumped track, the columns are memoryviews over the file so nothing is copied
+        The returned track is read only
+        """
+        with open(file_path, "rb") as file:
+            if os.fstat(file.fileno()).st_size < cls.HEADER.size:
+                raise ValueError(f"{file_path} is not a track file")
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count = cls.HEADER.unpack_from(mapped)
+        if magic != cls.MAGIC:
+            raise ValueError(f"{file_path} is not a track file")
+
+        columns = {}
+        start = cls.HEADER.size
+        for name in cls.COLUMNS:
+            type_code = cls.TYPES[name]
+            end = start + count * array(type_code).itemsize
+            if len(mapped) < end:
+                raise ValueError(f"{file_path} is truncated")
+
+            view = memoryview(mapped)[start:end]
+            if sys.byteorder != "little":
+                # the file is little endian, so on big endian machines the column has to be copied and swapped
+                column = array(type_code, view.tobytes())
+                column.byteswap()
+                columns[name] = column
+            else:
+                columns[name] = view.cast(type_code)
+            start = end
+
+        return cls(columns)
+
+
+class TrackRecorder:
+    """
+    Appends a sample to a Track at a fixed rate on a background thread
+    The radio and rotor functions receive a unix timestamp and return the matching info dictionary
+    """
+
+    def __init__(self, track, radio_function, rotctl_function, rate):
+        """
+        rate is in samples per second
+        """
+        self.track = track
+        self.radio_function = radio_function
+        self.rotctl_function = rotctl_function
+        self.rate = rate
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Starts recording the track, a rate of 0 means that no track is recorded
+        """
+        if not self.rate:
+            return False
+
+        self.thread = threading.Thread(target=self.run, name="TrackRecorder", daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        """
+        Stops recording and waits for the last sample to be stored
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+
+    def run(self):
+        """
+        Recording loop, a sample that can not be read from either device is stored with nan values
+        """
+        period = 1.0 / self.rate
+        next_sample = time.time()
+
+        while not self.stop_event.is_set():
+            timestamp = time.time()
+
+            try:
+                radio_dict = self.radio_function(timestamp)
+            except Exception as e:
+                print("Error getting radio info for the track: ", e)
+                radio_dict = {}
+
+            try:
+                rotctl_dict = self.rotctl_function(timestamp)
+            except Exception as e:
+                print("Error getting rotctl info for the track: ", e)
+                rotctl_dict = {}
+
+            self.track.append(timestamp, rotctl_dict.get("azimuth"), rotctl_dict.get("elevation"), radio_dict.get("dbfs"), radio_dict.get("frequency"))
+
+            next_sample += period
+            delay = next_sample - time.time()
+            if delay < 0:
+                next_sample = time.time()
+                delay = 0
+            self.stop_event.wait(delay)